@@ -3,6 +3,9 @@
 
 from typing import Tuple, Union
 import os
+import sys
+import glob
+import argparse
 import tkinter as tk
 from tkinter import ttk, filedialog, colorchooser, messagebox
 from PIL import Image, ImageTk
@@ -190,11 +193,12 @@ class PlayerRegisterWidget(NewWindow):
         if save_path:
             self.object.update_player_data(self.widget_list)
             self.object.save(save_path)
+            self.manager.records.invalidate(save_path)
 
     def _load_data(self):
         open_path = super()._open_filedialogwindow("プレイヤーデータ読み込み", "Player")
         if open_path:
-            self.object.load_player_data(open_path)
+            self.object.data = self.manager.records.load(Obj.Player, open_path).data.copy()
             self.widget_list["名前"].delete(0, tk.END)
             self.widget_list["名前"].insert(0, self.object.data.name)
             self.widget_list["使用キャラ"].set(self.object.data.character)
@@ -279,11 +283,12 @@ class TeamRegisterWidget(NewWindow):
         save_path = super()._save_filedialogwindow(filename, "チームデータ保存", "Team")
         if save_path:
             self.object.save(save_path)
+            self.manager.records.invalidate(save_path)
 
     def _load_data(self):
         open_path = super()._open_filedialogwindow("チームデータ読み込み", "Team")
         if open_path:
-            self.object.load_team_data(open_path)
+            self.object.data = self.manager.records.load(Obj.Team, open_path).data.copy()
             self.team_name_entry_box.delete(0, tk.END)
         self.team_name_entry_box.insert(0, self.object.data.name)
         self.object_image = self._create_imageTK(self.object.data.image, (100, 100))
@@ -464,8 +469,8 @@ class StreamLayoutWidget(NewWindow):
     def window_create(self):
         super().window_create()
         self.menu.add_cascade(label="オブジェクト読み込み", command=self.add_object)
-        self.menu.add_cascade(label="レイアウト保存")
-        self.menu.add_cascade(label="レイアウト読み込み")
+        self.menu.add_cascade(label="レイアウト保存", command=self.save_layout)
+        self.menu.add_cascade(label="レイアウト読み込み", command=self.load_layout)
 
         left_frame = tk.Frame(self.window)
         left_frame.pack(side=tk.LEFT, padx=5)
@@ -489,6 +494,24 @@ class StreamLayoutWidget(NewWindow):
             self.canvas.add_layout(data)
             self.manager.frame_update()
 
+    def save_layout(self):
+        filepath = self._save_filedialogwindow("", "レイアウト保存", parent_folder="StreamLayout")
+        if filepath:
+            Obj.save(filepath, self.manager.layout.get())
+
+    def load_layout(self):
+        filepath = self._open_filedialogwindow("レイアウト読み込み", parent_folder="StreamLayout")
+        if filepath:
+            self.canvas.rect_delete()
+            self.canvas.tag = False
+            for id in list(self.manager.layout.get().keys()):
+                self.canvas.delete_element(id)
+                self.canvas.widgets.pop(id).frame_pack_forget()
+                self.manager.layout.delete_layout_collection(id)
+            for data in Obj.load(filepath).values():
+                self.canvas.add_layout(data)
+            self.manager.frame_update()
+
 
 class SettingWidget(NewWindow):
     def __init__(self, manager: Manager):
@@ -518,5 +541,57 @@ def run():
 	app.mainloop()
 
 
+def migrate():
+    paths = glob.glob("StreamHelper/Gametitle/*/Player/*.shd")
+    paths += glob.glob("StreamHelper/Gametitle/*/Team/*.shd")
+    paths += glob.glob("StreamHelper/LayoutObject/*.shd")
+    for path in paths:
+        if Obj.migrate(path):
+            print(f"変換しました: {path}")
+
+
+def command(argv: "list[str]"):
+    parser = argparse.ArgumentParser(prog="StreamHelper")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("migrate", help="旧形式(pickle)の.shdファイルを新形式に変換します")
+    pack_parser = subparsers.add_parser("pack", help="ゲームタイトルのキャラクター・プレイヤー・チームを1つのパックファイルにまとめます")
+    pack_parser.add_argument("titles", nargs="*", help="対象のゲームタイトル（省略時は全タイトル）")
+    render_parser = subparsers.add_parser("render", help="配信レイアウトと対戦表から試合ごとの画像をまとめて生成します")
+    render_parser.add_argument("layout", help="保存した配信レイアウト(.shd)")
+    render_parser.add_argument("matches", help="対戦表(.csv / .json)")
+    render_parser.add_argument("--title", default="", help="ゲームタイトル（省略時は最初のタイトル）")
+    render_parser.add_argument("--output", default="StreamHelper/Batch", help="出力先フォルダ")
+    render_parser.add_argument("--jobs", type=int, default=0, help="並列数（省略時はCPU数）")
+    bench_parser = subparsers.add_parser("bench", help="合成処理のベンチマークを実行します")
+    bench_parser.add_argument("--elements", type=int, nargs="+", default=[4, 16, 64], help="レイアウトのエレメント数")
+    bench_parser.add_argument("--repeat", type=int, default=10, help="各処理の繰り返し回数")
+    bench_parser.add_argument("--save", help="結果を基準として保存する名前")
+    bench_parser.add_argument("--compare", help="比較する基準の名前")
+    bench_parser.add_argument("--threshold", type=float, default=1.2, help="基準より何倍遅ければ悪化とみなすか")
+    args = parser.parse_args(argv)
+    if args.command == "migrate":
+        migrate()
+    elif args.command == "pack":
+        for title in args.titles or os.listdir("StreamHelper/Gametitle"):
+            print(f"作成しました: {Obj.build_pack(title)}")
+    elif args.command == "render":
+        # BatchとBenchmarkはGUIの起動では使わないので、コマンドを実行するときだけ読み込む
+        import Batch
+        title = args.title or os.listdir("StreamHelper/Gametitle")[0]
+        if Batch.run(args.layout, args.matches, title, args.output, args.jobs):
+            sys.exit(1)
+    elif args.command == "bench":
+        import Benchmark
+        results = Benchmark.run(args.elements, args.repeat)
+        [print(result) for result in results]
+        if args.save:
+            print(f"保存しました: {Benchmark.save_baseline(args.save, results)}")
+        if args.compare and Benchmark.compare(args.compare, results, args.threshold):
+            sys.exit(1)
+
+
 if __name__ == "__main__":
-    run()
+    if len(sys.argv) > 1:
+        command(sys.argv[1:])
+    else:
+        run()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from typing import Tuple, Union
+import os
+import csv
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import Object as Obj
+import Output
+import Render
+
+# 対戦表(CSV/JSON)の各試合の画像をまとめて生成する
+# JSON: [{"name": "試合名", "values": {コレクションID: {エレメントID: 値, ...}, ...}}, ...]
+# CSV : 1列目が name、以降の列名は "コレクションID.キー" (チームは "コレクションID.コレクションID.キー")
+#       check_ で始まるキーは 1/true/yes を真として扱う
+
+# ワーカープロセスごとに1回だけ読み込み、以降の試合で使い回す
+WORKER: "dict[str, Union[Render.ImageGenerator, dict]]" = {}
+# 試合名はそのまま出力ファイル名に使うので、フォルダの区切りやWindowsで使えない文字は受け付けない
+INVALID_NAME_CHARS = set('<>:"/\\|?*')
+
+
+def check_name(name: str) -> str:
+    if (not name.strip() or name != name.rstrip(". ")
+            or any(c in INVALID_NAME_CHARS or ord(c) < 32 for c in name)):
+        raise ValueError(f"ファイル名に使えない試合名です: {name!r}")
+    return name
+
+def load_matches(filepath: str) -> "list[Tuple[str, dict]]":
+    if os.path.splitext(filepath)[1].lower() == ".json":
+        with open(filepath, encoding="utf-8") as f:
+            return [(check_name(str(match["name"])), match["values"]) for match in json.load(f)]
+    matches = []
+    with open(filepath, encoding="utf-8-sig", newline="") as f:
+        for row in csv.DictReader(f):
+            name = check_name(row.pop("name"))
+            values = {}
+            for column, value in row.items():
+                keys = column.split(".")
+                dic = values
+                for key in keys[:-1]:
+                    dic = dic.setdefault(key, {})
+                if keys[-1].startswith("check_"):
+                    dic[keys[-1]] = value.strip().lower() in ("1", "true", "yes")
+                else:
+                    dic[keys[-1]] = value
+            matches.append((name, values))
+    return matches
+
+def worker_init(layout_path: str, title: str):
+    layout_dic = Obj.load(layout_path)
+    if not isinstance(layout_dic, dict):
+        raise ValueError(f"配信レイアウトのファイルではありません: {layout_path}")
+    setting = Render.ManagerSetting()
+    setting.output_mode = "file"
+    WORKER["layout_dic"] = layout_dic
+    WORKER["generator"] = Render.ImageGenerator(Render.RenderContext(title, setting))
+
+def render_match(name: str, values: dict, output_dir: str) -> Tuple[str, float, Output.OutputTiming]:
+    check_name(name)
+    start = time.perf_counter()
+    generator: Render.ImageGenerator = WORKER["generator"]
+    generator.compose(values, WORKER["layout_dic"])
+    timing = Output.OutputTiming()
+    for target in generator.targets:
+        timing += target.write(generator.image, f"{output_dir}/{name}_{os.path.basename(target.path)}")
+    return name, time.perf_counter() -start, timing
+
+def run(layout_path: str, matches_path: str, title: str, output_dir: str, jobs: int=0) -> int:
+    matches = load_matches(matches_path)
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = jobs or os.cpu_count() or 1
+    failed = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=min(jobs, len(matches)) or 1, initializer=worker_init,
+                             initargs=(layout_path, title)) as executor:
+        futures = {executor.submit(render_match, name, values, output_dir): name for name, values in matches}
+        for future in as_completed(futures):
+            try:
+                name, elapsed, timing = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"失敗しました: {futures[future]} ({e!r})")
+            else:
+                print(f"生成しました: {name} ({elapsed *1000:.0f}ms: {timing})")
+    print(f"{len(matches) -failed}/{len(matches)}件 {time.perf_counter() -start:.1f}秒")
+    return failed
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from typing import Callable, Tuple, Union
+from dataclasses import dataclass, asdict
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import statistics
+import tracemalloc
+import PIL
+from PIL import Image, ImageDraw
+import Object as Obj
+import Render
+
+# 合成処理のベンチマーク。Tkのルートウィンドウを作らずに、一時フォルダに生成した合成用データで計測する
+# フォントと既定画像だけは生成できないので StreamHelper/Font と StreamHelper/image からコピーする
+TITLE = "BENCHMARK"
+BASELINE_DIR = "StreamHelper/Benchmark"
+PLAYER_COUNT = 8
+COUNTER_FOLDER = "StreamHelper/Counter/BENCHMARK"
+
+
+@dataclass
+class StageResult:
+    stage: str
+    elements: int
+    median: float
+    minimum: float
+    python_peak: int
+    python_allocated: int
+    images: int
+    blocks: int
+
+    def __str__(self) -> str:
+        return (f"{self.stage:<32}{self.elements:>5}  median {self.median *1000:8.2f}ms  min {self.minimum *1000:8.2f}ms"
+                f"  py peak {self.python_peak /1024:8.0f}KB  py alloc {self.python_allocated /1024:8.0f}KB"
+                f"  images {self.images:>4}  blocks {self.blocks:>3}")
+
+
+def create_assets(root: str, source: str):
+    base = f"{root}/StreamHelper"
+    shutil.copytree(f"{source}/Font", f"{base}/Font")
+    shutil.copytree(f"{source}/image", f"{base}/image")
+    shutil.copy(f"{source}/Setting.ini", f"{base}/Setting.ini")
+    game_root = f"{base}/Gametitle/{TITLE}"
+    for category in ("Character", "Player", "Team"):
+        os.makedirs(f"{game_root}/{category}")
+    for i in range(PLAYER_COUNT):
+        os.makedirs(f"{game_root}/Character/character_{i}")
+        create_gradient((400, 400), i).save(f"{game_root}/Character/character_{i}/face.png")
+        data = Obj.PlayerData(f"プレイヤー{i}", TITLE, f"character_{i}", "", create_gradient((256, 256), i +PLAYER_COUNT))
+        Obj.save(f"{game_root}/Player/player_{i}.shd", data)
+    os.makedirs(f"{root}/{COUNTER_FOLDER}")
+    for i in range(10):
+        image = Image.new("RGBA", (128, 128), (255, 255, 255, 0))
+        draw = ImageDraw.Draw(image)
+        draw.ellipse((8, 8, 120, 120), fill=(40 *i %255, 128, 255 -20 *i, 255))
+        draw.text((56, 56), str(i), fill="white")
+        image.save(f"{root}/{COUNTER_FOLDER}/{i}.png")
+
+def create_gradient(size: Tuple[int], seed: int) -> Image.Image:
+    gradient = Image.linear_gradient("L").resize(size)
+    return Image.merge("RGBA", (gradient, Image.new("L", size, seed *20 %256), gradient.transpose(Image.FLIP_LEFT_RIGHT),
+                                Image.new("L", size, 255)))
+
+def create_layout(count: int, font: str) -> "list[Obj.LayoutData]":
+    counter_images = {}
+    for path in os.listdir(COUNTER_FOLDER):
+        with Image.open(f"{COUNTER_FOLDER}/{path}") as image:
+            image.load()
+        counter_images[os.path.splitext(path)[0]] = image
+    kinds = [
+        ("VariableTextLayoutObject", "Player", "プレイヤー名", (240, 40)),
+        ("VariableImageLayoutObject", "Player", "キャラクター画像", (120, 120)),
+        ("CounterTextLayoutObject", "Counter", "カウンター", (60, 60)),
+        ("CounterImageLayoutObject", "Counter", "カウンター画像", (60, 60))
+    ]
+    layout = []
+    for i in range(count):
+        cls, category, name, size = kinds[i %len(kinds)]
+        column, row = i %8, i //8
+        position = [column *110, row *60, column *110 +size[0], row *60 +size[1]]
+        data = Obj.LayoutData(name=name, category=category, id=f"id_{i}", cls=cls,
+                              font=Obj.FontData(font=font, fill="#FFFFFF", stroke_width=4),
+                              width=size[0], height=size[1], position=position,
+                              alpha=255 if i %5 else 160)
+        data.image = Image.new("RGBA", size, (255, 255, 255, 100))
+        if cls == "CounterImageLayoutObject":
+            data.image_list = counter_images
+        layout.append(data)
+    return layout
+
+def create_values(layout: "list[Obj.LayoutData]") -> dict:
+    values = {}
+    for i, data in enumerate(layout):
+        if data.category == "Player":
+            values[data.id] = f"player_{i %PLAYER_COUNT}"
+        else:
+            values[data.id] = str(i %10)
+    return values
+
+def measure(stage: str, elements: int, func: Callable, repeat: int) -> StageResult:
+    func()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() -start)
+    # メモリは計測時間に影響するので別に1回だけ実行して測る
+    stats = Image.core.get_stats()
+    tracemalloc.start()
+    func()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    after = Image.core.get_stats()
+    return StageResult(stage, elements, statistics.median(times), min(times), peak, current,
+                       after["new_count"] -stats["new_count"], after["allocated_blocks"] -stats["allocated_blocks"])
+
+def run_stages(count: int, font: str, repeat: int) -> "list[StageResult]":
+    setting = Render.ManagerSetting()
+    setting.output_name = "Benchmark.png"
+    setting.output_mode = "file"
+    setting.output_targets = []
+    generator = Render.ImageGenerator(Render.RenderContext(TITLE, setting))
+    layout = create_layout(count, font)
+    collection = Obj.LayoutCollection(layout, "benchmark", "benchmark")
+    layout_dic = {collection.id: collection}
+    values = create_values(layout)
+    generator.value_dic = {collection.id: values}
+    texts = [data for data in layout if "Text" in data.cls]
+    counter = next(data for data in layout if data.category == "Counter")
+    steps = iter(range(1, 1 << 30))
+
+    def text():
+        for data in texts:
+            Obj.create_text_image(f"テキスト{data.id}", data.font, (data.width *2, data.height *2))
+
+    def layout_image():
+        # レイヤーだけでなくエレメント・不透明度・文字画像のキャッシュも空にして、重ね合わせそのものを測る
+        generator.reset()
+        Obj.TEXT_IMAGE_CACHE.clear()
+        generator.generate_layout(collection)
+
+    def full_render():
+        generator.reset()
+        generator.create_image({collection.id: values}, layout_dic)
+
+    def incremental_render():
+        # カウンターを1つだけ変えたときの差分合成
+        generator.create_image({collection.id: dict(values, **{counter.id: str(next(steps) %10)})}, layout_dic)
+
+    results = [
+        measure("create_text_image", count, text, repeat),
+        measure("LayoutCollection.create_image", count, collection.create_image, repeat),
+        measure("generate_layout", count, layout_image, repeat),
+        measure("create_image", count, full_render, repeat),
+        measure("create_image(incremental)", count, incremental_render, repeat)
+    ]
+    generator.reset()
+    return results
+
+def run(counts: "list[int]", repeat: int=10) -> "list[StageResult]":
+    source = os.path.abspath("StreamHelper")
+    font = sorted(os.listdir(f"{source}/Font"))[0]
+    current = os.getcwd()
+    root = tempfile.mkdtemp(prefix="StreamHelperBenchmark")
+    try:
+        os.chdir(root)
+        create_assets(root, source)
+        results = []
+        for count in counts:
+            results += run_stages(count, font, repeat)
+    finally:
+        os.chdir(current)
+        Obj.close_pack(TITLE)
+        shutil.rmtree(root, ignore_errors=True)
+    return results
+
+def baseline_path(name: str) -> str:
+    return f"{BASELINE_DIR}/{name}.json"
+
+def save_baseline(name: str, results: "list[StageResult]") -> str:
+    os.makedirs(BASELINE_DIR, exist_ok=True)
+    data = {
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": sys.version.split()[0],
+        "pillow": PIL.__version__,
+        "platform": platform.platform(),
+        "results": [asdict(result) for result in results]
+    }
+    with open(baseline_path(name), "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    return baseline_path(name)
+
+def load_baseline(name: str) -> "dict[Tuple[str, int], StageResult]":
+    with open(baseline_path(name), encoding="utf-8") as f:
+        data = json.load(f)
+    return {(result["stage"], result["elements"]): StageResult(**result) for result in data["results"]}
+
+def compare(name: str, results: "list[StageResult]", threshold: float=1.2) -> "list[StageResult]":
+    baseline = load_baseline(name)
+    regressions = []
+    for result in results:
+        base: Union[StageResult, None] = baseline.get((result.stage, result.elements))
+        if base is None:
+            print(f"{result.stage:<32}{result.elements:>5}  基準なし")
+            continue
+        ratio = result.median /base.median if base.median else 0.0
+        mark = ""
+        if ratio > threshold:
+            mark = "  遅くなりました"
+            regressions.append(result)
+        print(f"{result.stage:<32}{result.elements:>5}  {base.median *1000:8.2f}ms -> {result.median *1000:8.2f}ms"
+              f"  x{ratio:.2f}  images {base.images} -> {result.images}{mark}")
+    return regressions
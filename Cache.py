@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from typing import Any, Callable, Hashable
+from collections import OrderedDict
+import threading
+from PIL import Image
+
+
+class LRUCache:
+    # フォント・文字画像・キャラクター画像のキャッシュはTkのスレッドと描画スレッドの両方から使うので、操作ごとにロックを取る
+    def __init__(self, capacity: int, sizeof: Callable[[Any], int]=None):
+        self.capacity = capacity
+        self.sizeof = sizeof if sizeof is not None else lambda value: 1
+        self.dict: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self.sizes: "dict[Hashable, int]" = {}
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.RLock()
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self.dict)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self.lock:
+            return key in self.dict
+
+    def get(self, key: Hashable, default: Any=None) -> Any:
+        with self.lock:
+            if key in self.dict:
+                self.hits += 1
+                self.dict.move_to_end(key)
+                return self.dict[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any):
+        size = self.sizeof(value)
+        with self.lock:
+            if key in self.dict:
+                self.pop(key)
+            if size > self.capacity:
+                return
+            self.dict[key] = value
+            self.sizes[key] = size
+            self.size += size
+            self.evict()
+
+    def pop(self, key: Hashable, default: Any=None) -> Any:
+        with self.lock:
+            if key not in self.dict:
+                return default
+            self.size -= self.sizes.pop(key)
+            return self.dict.pop(key)
+
+    def evict(self):
+        with self.lock:
+            while self.size > self.capacity and len(self.dict):
+                key = next(iter(self.dict))
+                self.pop(key)
+
+    def resize(self, capacity: int):
+        with self.lock:
+            self.capacity = capacity
+            self.evict()
+
+    def clear(self):
+        with self.lock:
+            self.dict.clear()
+            self.sizes.clear()
+            self.size = 0
+
+    def stats(self) -> "dict[str, int]":
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "length": len(self.dict),
+                "size": self.size,
+                "capacity": self.capacity
+            }
+
+
+def image_size(image: Image.Image) -> int:
+    return image.width * image.height * len(image.getbands())
+
+def megabyte(value: int) -> int:
+    return value * 1024 * 1024
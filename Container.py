@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from typing import Tuple, Union
+from dataclasses import dataclass, field
+import os
+import io
+import json
+import mmap
+import struct
+from PIL import Image
+
+# .shdファイルのレイアウト
+# [MAGIC 4byte][VERSION uint16][ヘッダー長 uint32][ヘッダー(JSON)][blob領域]
+# ヘッダーには kind / meta / blobs(名前: [offset, length, format]) が入り、offsetはblob領域の先頭からの位置
+MAGIC = b"SHDC"
+VERSION = 1
+PREFIX = struct.Struct("<4sHI")
+IMAGE_FORMAT = "PNG"
+
+
+class ContainerError(Exception):
+    pass
+
+
+class LazyImage:
+    def __init__(self, data: bytes, format: str=IMAGE_FORMAT):
+        self.data = data
+        self.format = format
+
+    def decode(self) -> Image.Image:
+        with Image.open(io.BytesIO(self.data)) as image:
+            image.load()
+        return image
+
+
+class ImageField:
+    def __set_name__(self, owner, name: str):
+        self.name = name
+
+    def __get__(self, obj, objtype=None) -> Union[Image.Image, None]:
+        if obj is None:
+            return None
+        value = obj.__dict__.get(self.name)
+        if isinstance(value, LazyImage):
+            value = value.decode()
+            obj.__dict__[self.name] = value
+        return value
+
+    def __set__(self, obj, value: Union[Image.Image, LazyImage, None]):
+        obj.__dict__[self.name] = value
+
+
+@dataclass
+class Container:
+    kind: str
+    meta: dict
+    blobs: "dict[str, LazyImage]" = field(default_factory=dict)
+
+    def image(self, name: str) -> Union[LazyImage, None]:
+        return self.blobs.get(name)
+
+
+def encode_image(image: Image.Image, format: str=IMAGE_FORMAT) -> bytes:
+    buffer = io.BytesIO()
+    if format == "WEBP":
+        image.save(buffer, format=format, lossless=True)
+    else:
+        image.save(buffer, format=format)
+    return buffer.getvalue()
+
+def is_container(filepath: str) -> bool:
+    with open(filepath, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+def write(filepath: str, container: Container, images: "dict[str, Image.Image]", format: str=IMAGE_FORMAT):
+    payloads = {name: (encode_image(image, format), format) for name, image in images.items() if image is not None}
+    write_raw(filepath, container, payloads)
+
+def write_raw(filepath: str, container: Container, payloads: "dict[str, Tuple[bytes, str]]"):
+    index = {}
+    offset = 0
+    for name, (data, format) in payloads.items():
+        index[name] = [offset, len(data), format]
+        offset += len(data)
+    header = json.dumps({"kind": container.kind, "meta": container.meta, "blobs": index},
+                        ensure_ascii=False).encode("utf-8")
+    temp_path = f"{filepath}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(PREFIX.pack(MAGIC, VERSION, len(header)))
+        f.write(header)
+        [f.write(data) for data, _ in payloads.values()]
+    os.replace(temp_path, filepath)
+
+def parse(data: Union[bytes, mmap.mmap]) -> Tuple[dict, int]:
+    magic, version, header_length = PREFIX.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ContainerError("StreamHelperのデータファイルではありません")
+    if version > VERSION:
+        raise ContainerError(f"未対応のバージョンです: {version}")
+    start = PREFIX.size
+    header = json.loads(bytes(data[start:start +header_length]).decode("utf-8"))
+    return header, start +header_length
+
+def read(filepath: str) -> Container:
+    with open(filepath, "rb") as f:
+        return read_bytes(f.read())
+
+def read_bytes(data: bytes) -> Container:
+    header, blob_start = parse(data)
+    blobs = {}
+    for name, (offset, length, format) in header["blobs"].items():
+        blobs[name] = LazyImage(data[blob_start +offset:blob_start +offset +length], format)
+    return Container(header["kind"], header["meta"], blobs)
+
+
+class Pack:
+    def __init__(self, filepath: str):
+        self.path = filepath
+        self.file = open(filepath, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.stamp = os.fstat(self.file.fileno()).st_mtime_ns
+        header, self.blob_start = parse(self.map)
+        self.kind: str = header["kind"]
+        self.meta: dict = header["meta"]
+        self.index: "dict[str, list]" = header["blobs"]
+        # パック作成後に保存し直された元ファイルの名前。パックより元ファイルを優先する
+        self.overrides: "set[str]" = set()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.index
+
+    def source_stamp(self, name: str) -> int:
+        # 作成時の元ファイルの更新時刻。記録のない古いパックはパック自体の更新時刻で代用する
+        return self.meta.get("stamps", {}).get(name, self.stamp)
+
+    def read(self, name: str) -> bytes:
+        offset, length, _ = self.index[name]
+        start = self.blob_start +offset
+        return self.map[start:start +length]
+
+    def image(self, name: str) -> Image.Image:
+        return LazyImage(self.read(name), self.index[name][2]).decode()
+
+    def close(self):
+        self.map.close()
+        self.file.close()
@@ -1,15 +1,18 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from typing import Union, Tuple
+from typing import Union, Tuple, Callable
 import os
-import configparser
-from dataclasses import dataclass
+import time
+import queue
+import threading
 import random
 import tkinter as tk
-from PIL import Image
+from tkinter import messagebox
 import Object as Obj
 import Widget as Wid
+import Output
+from Render import ManagerSetting, RecordStore, ImageGenerator
 
 class Manager:
     def __init__(self, parent):
@@ -18,10 +21,16 @@ class Manager:
         self.game = ""
         self.setting = ManagerSetting()
         self.gametitle_list = os.listdir("StreamHelper/Gametitle")
+        self.records = RecordStore()
+        self.generator = ImageGenerator(self)
+        self.worker = RenderWorker(self.frame, self.generator.create_image,
+                                   self.generate_complete, self.generate_error)
         self.gametitle_select(0)
 
     def gametitle_select(self, num: int):
-        self.game = Obj.GameTitle(self.gametitle_list[num])
+        with self.generator.lock:
+            self.game = Obj.GameTitle(self.gametitle_list[num])
+            self.generator.reset()
 
     def random_id(self, n):
         return str(random.randrange(10**(n-1),10**n))
@@ -74,30 +83,66 @@ class Manager:
 
 
     def generate_image(self):
-        generator = ImageGenerator(self, self.frame.get(), self.layout.get())
-        generator.create_image()
-
-
-@dataclass
-class ManagerSetting:
-    character_image_file_name :str = ""
-    output_name: str = ""
-
-    def __init__(self):
-        self.setting_ini = configparser.ConfigParser()
-        setting_ini_path = "StreamHelper/Setting.ini"
-        self.setting_ini.read(setting_ini_path, encoding="utf-8")
-        self.setting = self.setting_ini["USER_SETTING"]
-        self.load()
-
-    def load(self):
-        self.character_image_file_name = self.setting["character_image_file_name"]
-        self.output_name = self.setting["output_name"]
-
-    def save(self):
-        with open("Sample.ini", "w") as configfile:
-            self.setting_ini.write(configfile)
+        # 位置・大きさ・反転はTkスレッドで写し取り、描画スレッドでは元のコレクションを読まない
+        layout_dic = {id: collection.snapshot() for id, collection in self.layout.get().items()}
+        self.worker.submit(self.frame.get(), layout_dic)
+        self.frame.status_update("生成中...")
+
+    def generate_complete(self, elapsed: float, timing: Union[Output.OutputTiming, None]):
+        if timing is None:
+            self.frame.status_update(f"変更なし ({elapsed *1000:.0f}ms)")
+        else:
+            self.frame.status_update(f"生成完了 ({elapsed *1000:.0f}ms: {timing})")
+
+    def generate_error(self, error: Exception):
+        self.frame.status_update("生成失敗")
+        messagebox.showerror("Error", f"画像生成に失敗しました\n{error!r}", parent=self.frame)
+
+
+class RenderWorker:
+    def __init__(self, widget: tk.Misc, method: Callable, complete: Callable, error: Callable, interval: int=30):
+        self.widget = widget
+        self.method = method
+        self.complete = complete
+        self.error = error
+        self.interval = interval
+        self.condition = threading.Condition()
+        self.pending: Union[tuple, None] = None
+        self.coalesced = 0
+        self.results: "queue.Queue[Tuple[bool, Union[tuple, Exception]]]" = queue.Queue()
+        self.thread = threading.Thread(target=self.run, name="RenderWorker", daemon=True)
+        self.thread.start()
+        self.widget.after(self.interval, self.poll)
+
+    def submit(self, *args):
+        with self.condition:
+            if self.pending is not None:
+                self.coalesced += 1
+            self.pending = args
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.pending is None:
+                    self.condition.wait()
+                args, self.pending = self.pending, None
+            start = time.perf_counter()
+            try:
+                result = self.method(*args)
+            except Exception as e:
+                self.results.put((False, e))
+            else:
+                self.results.put((True, (time.perf_counter() -start, result)))
 
+    def poll(self):
+        while not self.results.empty():
+            success, result = self.results.get_nowait()
+            if success:
+                self.complete(*result)
+            else:
+                self.error(result)
+        self.widget.after(self.interval, self.poll)
 
 
 class ManagerFrame(tk.Frame):
@@ -129,6 +174,8 @@ class ManagerFrame(tk.Frame):
         self.pack()
         create_button = tk.Button(self, text="画像生成", width=20, command=self.manager.generate_image)
         create_button.pack()
+        self.status_label = tk.Label(self, text="")
+        self.status_label.pack()
 
     def reset(self):
         keys = [key for key in self.frame_dic.keys()]
@@ -150,6 +197,9 @@ class ManagerFrame(tk.Frame):
     def get(self) -> "dict[str: str]":
         return self.widgets.get()
 
+    def status_update(self, text: str):
+        self.status_label.config(text=text)
+
 
 class LayoutManager:
     def __init__(self, manager: Manager):
@@ -182,96 +232,5 @@ class LayoutManager:
         return self.layout_dic
 
 
-class ImageGenerator:
-    def __init__(self, manager: Manager, value_dic: "dict", layout_dic: "dict[str: Obj.LayoutCollection]"):
-        self.manager = manager
-        self.value_dic = value_dic
-        self.layout_dic = layout_dic
-
-    def create_image(self):
-        image = Image.new("RGBA", (1920, 1080), (255, 255, 255, 0))
-        for _, layouts in self.layout_dic.items():
-            img = self.generate_layout(layouts)
-            image.paste(img, self.get_box(False, layouts), mask=img)
-        image.save(f"StreamHelper/{self.manager.setting.output_name}")
-
-    def get_value(self, object: Obj.LayoutData, dic: dict, master_key: str="") -> Union[str, Image.Image]:
-        if "Const" in object.cls:
-            return ""
-        else:
-            if object.category == "Team":
-                value = dic[master_key]
-                if "チーム" in object.name:
-                    value = value[master_key]
-                    team = Obj.Team.load(f"StreamHelper/Gametitle/{self.manager.game.title}/Team/{value}.shd")
-                    if "名" in object.name:
-                        return team.data.name
-                    if "画像" in object.name:
-                        return team.data.image
-                else:
-                    check = value[f"check_{object.id}"]
-                    value = value[object.id]
-                    player = Obj.Player.load(f"StreamHelper/Gametitle/{self.manager.game.title}/Player/{value}.shd")
-                    if object.name == "プレイヤー名":
-                        return player.data.name
-                    if object.name == "プレイヤー画像":
-                        if check:
-                            return player.data.image.convert("LA")
-                        else:
-                            return player.data.image
-                    if object.name == "キャラクター名":
-                        return player.data.character
-                    if object.name == "キャラクター画像":
-                        if check:
-                            return Image.open(f"StreamHelper/Gametitle/{self.manager.game.title}/Character/{player.data.character}/{self.manager.setting.character_image_file_name}").convert("LA")
-                        else:
-                            return Image.open(f"StreamHelper/Gametitle/{self.manager.game.title}/Character/{player.data.character}/{self.manager.setting.character_image_file_name}")
-            else:
-                value = dic[object.id]
-                if object.category == "Player":
-                    player = Obj.Player.load(f"StreamHelper/Gametitle/{self.manager.game.title}/Player/{value}.shd")
-                    if object.name == "プレイヤー名":
-                        return player.data.name
-                    if object.name == "プレイヤー画像":
-                        return player.data.image
-                    if object.name == "キャラクター名":
-                        return player.data.character
-                    if object.name == "キャラクター画像":
-                        return Image.open(f"StreamHelper/Gametitle/{self.manager.game.title}/Character/{player.data.character}/{self.manager.setting.character_image_file_name}")
-                if object.category == "Counter":
-                    if "Text" in object.cls:
-                        return value
-                    if "Image" in object.cls:
-                        return object.image_list[value]
-
-    def generate_layout(self, collection: Obj.LayoutCollection) -> Image.Image:
-        values = self.value_dic[collection.id]
-        image = Image.new("RGBA", (1920, 1080), (255, 255, 255, 0))
-        for layout in reversed(collection.list):
-            value = self.get_value(layout, values, collection.id)
-            element = Obj.layout_element_check(layout).load_cls(layout)
-            element_image = element.generate_image(value, collection.mirror)
-            if element_image.mode != "RGBA":
-                element_image = element_image.convert("RGBA")
-            if element.alpha != 255:
-                _, _, _, alpha = element_image.split()
-                alpha.paste(Image.new("L",  element_image.size, element.alpha), mask=alpha)
-                image.paste(element_image, self.get_box(collection.mirror, element), mask=alpha)
-            else:
-                image.paste(element_image, self.get_box(collection.mirror, element), mask=element_image)
-        image = image.crop(image.getbbox())
-        image = image.resize((collection.width *2, collection.height *2))
-        return image
-
-    def get_box(self, mirror: bool, element: Union[Obj.LayoutElement, Obj.LayoutCollection]) -> Tuple[int]:
-        if mirror:
-            x = int(1920 - element.position[0]*2 - element.width*2)
-            y = int(element.position[1]*2)
-            return (x, y)
-        else:
-            return (int(element.position[0]*2), int(element.position[1]*2))
-
-
-
 if __name__ == "__main__":
     print(__name__)
\ No newline at end of file
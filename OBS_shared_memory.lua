@@ -0,0 +1,178 @@
+-- OBS Studio Lua Scripting
+-- StreamHelperが共有メモリに書き出したRGBAフレームを、エンコード・デコードなしでテクスチャに転送するソースを追加する
+-- StreamHelper側はSetting.iniの output_mode を shared_memory か both にして使う
+-- OBSのスクリプトでソースを登録できるのはLuaだけなので、共有メモリの読み出しとテクスチャへの転送はLuaJITのffiで行う
+-- StreamHelper本体と同じくWindows専用
+obs = obslua
+local ffi = require("ffi")
+
+-- Output.pyの共有メモリレイアウト("<4sHHIII4sQ")と同じ並び。詰め物は入らない
+ffi.cdef([[
+typedef struct streamhelper_frame_header {
+    char magic[4];
+    uint16_t version;
+    uint16_t reserved;
+    uint32_t width;
+    uint32_t height;
+    uint32_t stride;
+    char format[4];
+    uint64_t sequence;
+} streamhelper_frame_header;
+
+void *OpenFileMappingA(uint32_t access, int inherit, const char *name);
+void *MapViewOfFile(void *mapping, uint32_t access, uint32_t offset_high, uint32_t offset_low, size_t size);
+int UnmapViewOfFile(const void *address);
+int CloseHandle(void *handle);
+
+struct gs_texture;
+struct gs_texture *gs_texture_create(uint32_t width, uint32_t height, int color_format, uint32_t levels,
+                                     const uint8_t **data, uint32_t flags);
+void gs_texture_destroy(struct gs_texture *tex);
+void gs_texture_set_image(struct gs_texture *tex, const uint8_t *data, uint32_t linesize, bool invert);
+void obs_source_draw(struct gs_texture *image, int x, int y, uint32_t cx, uint32_t cy, bool flip);
+]])
+
+local libobs = ffi.load("obs")
+local MAGIC = "SHMF"
+local VERSION = 1
+local HEADER_SIZE = ffi.sizeof("streamhelper_frame_header")
+local FILE_MAP_READ = 0x0004
+-- StreamHelperが起動していないときに共有メモリを開き直す間隔(秒)
+local RETRY_INTERVAL = 1.0
+
+
+local function frame_close(data)
+    if data.view ~= nil then
+        ffi.C.UnmapViewOfFile(data.view)
+        data.view = nil
+    end
+    if data.mapping ~= nil then
+        ffi.C.CloseHandle(data.mapping)
+        data.mapping = nil
+    end
+    data.header = nil
+    data.pixels = nil
+    data.sequence = -1
+end
+
+local function frame_open(data)
+    local mapping = ffi.C.OpenFileMappingA(FILE_MAP_READ, 0, data.name)
+    if mapping == nil then
+        return false
+    end
+    local view = ffi.C.MapViewOfFile(mapping, FILE_MAP_READ, 0, 0, 0)
+    if view == nil then
+        ffi.C.CloseHandle(mapping)
+        return false
+    end
+    data.mapping = mapping
+    data.view = view
+    local header = ffi.cast("const streamhelper_frame_header *", view)
+    if ffi.string(header.magic, 4) ~= MAGIC or header.version ~= VERSION then
+        obs.script_log(obs.LOG_WARNING, "StreamHelperの共有メモリではありません: " .. data.name)
+        frame_close(data)
+        return false
+    end
+    data.header = header
+    data.pixels = ffi.cast("const uint8_t *", view) + HEADER_SIZE
+    return true
+end
+
+
+local source_def = {}
+source_def.id = "streamhelper_shared_memory_source"
+source_def.type = obs.OBS_SOURCE_TYPE_INPUT
+source_def.output_flags = obs.OBS_SOURCE_VIDEO
+
+source_def.get_name = function()
+    return "StreamHelper共有メモリ"
+end
+
+source_def.create = function(settings, source)
+    local data = {
+        name = obs.obs_data_get_string(settings, "shared_memory_name"),
+        retry = 0.0,
+        sequence = -1,
+        width = 1920,
+        height = 1080
+    }
+    return data
+end
+
+source_def.destroy = function(data)
+    frame_close(data)
+    if data.texture ~= nil then
+        obs.obs_enter_graphics()
+        libobs.gs_texture_destroy(data.texture)
+        obs.obs_leave_graphics()
+        data.texture = nil
+    end
+end
+
+source_def.update = function(data, settings)
+    frame_close(data)
+    data.name = obs.obs_data_get_string(settings, "shared_memory_name")
+    data.retry = 0.0
+end
+
+source_def.video_tick = function(data, seconds)
+    if data.header ~= nil then
+        return
+    end
+    data.retry = data.retry - seconds
+    if data.retry <= 0.0 then
+        data.retry = RETRY_INTERVAL
+        frame_open(data)
+    end
+end
+
+source_def.video_render = function(data, effect)
+    local header = data.header
+    if header ~= nil then
+        -- シーケンス番号は書き込み中は奇数。変化していて偶数のときだけ転送する
+        local before = tonumber(header.sequence)
+        if before % 2 == 0 and before ~= data.sequence then
+            local width, height = header.width, header.height
+            if data.texture == nil or width ~= data.width or height ~= data.height then
+                if data.texture ~= nil then
+                    libobs.gs_texture_destroy(data.texture)
+                end
+                data.width, data.height = width, height
+                data.texture = libobs.gs_texture_create(width, height, obs.GS_RGBA, 1, nil, obs.GS_DYNAMIC)
+            end
+            -- 共有メモリから直接GPUへ転送する。転送中に書き換わっていたら次のフレームで送り直す
+            libobs.gs_texture_set_image(data.texture, data.pixels, header.stride, false)
+            if tonumber(header.sequence) == before then
+                data.sequence = before
+            end
+        end
+    end
+    if data.texture ~= nil then
+        libobs.obs_source_draw(data.texture, 0, 0, 0, 0, false)
+    end
+end
+
+source_def.get_width = function(data)
+    return data.width
+end
+
+source_def.get_height = function(data)
+    return data.height
+end
+
+source_def.get_defaults = function(settings)
+    obs.obs_data_set_default_string(settings, "shared_memory_name", "StreamHelperFrame")
+end
+
+source_def.get_properties = function(data)
+    local props = obs.obs_properties_create()
+    obs.obs_properties_add_text(props, "shared_memory_name", "共有メモリ名", obs.OBS_TEXT_DEFAULT)
+    return props
+end
+
+obs.obs_register_source(source_def)
+
+
+function script_description()
+    return "StreamHelperが共有メモリに書き出した画像をエンコードなしで表示するソースを追加します (Windows専用)"
+end
@@ -3,10 +3,13 @@
 
 from __future__ import annotations
 from typing import Tuple, Union
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, replace, astuple, asdict
 import os
 import pickle
-from PIL import Image, ImageTk, ImageDraw, ImageFont, ImageOps
+import threading
+from PIL import Image, ImageDraw, ImageFont, ImageOps
+import Cache
+import Container
 
 
 @dataclass
@@ -14,40 +17,176 @@ class GameTitle:
     title: str
 
     def __post_init__(self):
+        # ゲームタイトルを選ぶたびにパックを開き直し、元ファイルが新しくなっていないかをここで確認する
+        self.pack = open_pack(self.title, reload=True)
         self._create_character_list(self.title)
-        self.player_list = os.listdir(f"StreamHelper/Gametitle/{self.title}/Player")
-        self.team_list = os.listdir(f"StreamHelper/Gametitle/{self.title}/Team")
+        self.player_list = self._create_record_list(self.title, "Player", "players")
+        self.team_list = self._create_record_list(self.title, "Team", "teams")
 
     def _create_character_list(self, title: str):
-        character_list = os.listdir(f"StreamHelper/Gametitle/{title}/character/")
+        if self.pack is not None:
+            character_list = self.pack.meta["characters"]
+        else:
+            character_list = os.listdir(f"StreamHelper/Gametitle/{title}/Character/")
         self.character_list = [Character(character_txt, title) for character_txt in character_list]
 
+    def _create_record_list(self, title: str, category: str, meta_key: str) -> "list[str]":
+        if self.pack is None:
+            return os.listdir(f"StreamHelper/Gametitle/{title}/{category}")
+        # パックにない記録は、このアプリで保存したものだけ一覧に加える
+        saved = [entry.split("/", 1)[1] for entry in sorted(SAVED_ENTRIES.get(title, ())) if entry.startswith(f"{category}/")]
+        return self.pack.meta[meta_key] +[file_name for file_name in saved if file_name not in self.pack.meta[meta_key]]
+
+    def character_image(self, name: str, file_name: str, grey: bool=False) -> Union[Image.Image, None]:
+        return load_character_image(self.title, name, file_name, grey)
+
 
 @dataclass
 class Character:
     name: str
     title: str
 
-    def __post_init__(self):
-        self.body = self._create_image_asset(f"StreamHelper/Gametitle/{self.title}/character/{self.name}/body.png")
-        self.face = self._create_image_asset(f"StreamHelper/Gametitle/{self.title}/character/{self.name}/face.png")
+    @property
+    def body(self) -> Union[Image.Image, None]:
+        return self.image("body.png")
 
-    def _create_image_asset(self, path: str) -> Tuple[Image.Image, None]:
-        if os.path.exists(path):
-            return Image.open(path)
-        else:
-            return None
+    @property
+    def face(self) -> Union[Image.Image, None]:
+        return self.image("face.png")
+
+    def image(self, file_name: str) -> Union[Image.Image, None]:
+        return load_character_image(self.title, self.name, file_name)
+
+
+CHARACTER_IMAGE_CACHE = Cache.LRUCache(Cache.megabyte(64), Cache.image_size)
+
+def load_character_image(title: str, name: str, file_name: str, grey: bool=False) -> Union[Image.Image, None]:
+    path = f"StreamHelper/Gametitle/{title}/Character/{name}/{file_name}"
+    if grey:
+        image = CHARACTER_IMAGE_CACHE.get((path, True))
+        if image is None:
+            image = load_character_image(title, name, file_name)
+            if image is not None:
+                image = grey_image(image)
+                CHARACTER_IMAGE_CACHE.set((path, True), image)
+        return image
+    image = CHARACTER_IMAGE_CACHE.get((path, False))
+    if image is None:
+        pack = packed_entry(title, f"Character/{name}/{file_name}")
+        if pack is not None:
+            image = pack.image(f"Character/{name}/{file_name}")
+        elif os.path.exists(path):
+            with Image.open(path) as image:
+                image.load()
+        if image is not None:
+            CHARACTER_IMAGE_CACHE.set((path, False), image)
+    return image
+
+def grey_image(image: Image.Image) -> Image.Image:
+    # チェック時のグレー表示用。合成でRGBAに戻すのでRGBAで持っておく
+    return image.convert("LA").convert("RGBA")
+
+
+PACK_NAME = "assets.pack"
+PACKS: "dict[str, Union[Container.Pack, None]]" = {}
+SAVED_ENTRIES: "dict[str, set[str]]" = {}
+
+def pack_path(title: str) -> str:
+    return f"StreamHelper/Gametitle/{title}/{PACK_NAME}"
+
+def open_pack(title: str, reload: bool=False) -> Union[Container.Pack, None]:
+    if reload:
+        close_pack(title)
+    if title not in PACKS:
+        path = pack_path(title)
+        pack = Container.Pack(path) if os.path.exists(path) else None
+        if pack is not None:
+            pack.overrides = loose_overrides(title, pack)
+        PACKS[title] = pack
+    return PACKS[title]
+
+def loose_overrides(title: str, pack: Container.Pack) -> "set[str]":
+    # 元ファイルの更新時刻はパックを開くときに1回だけ確認する。読み込みのたびには確認しない
+    overrides = set()
+    for entry in pack.index:
+        try:
+            if os.stat(f"StreamHelper/Gametitle/{title}/{entry}").st_mtime_ns > pack.source_stamp(entry):
+                overrides.add(entry)
+        except OSError:
+            pass
+    return overrides
+
+def packed_entry(title: str, entry: str) -> Union[Container.Pack, None]:
+    pack = open_pack(title)
+    if pack is None or entry not in pack or entry in pack.overrides:
+        return None
+    return pack
+
+def gametitle_entry(filepath: str) -> Union[Tuple[str, str], None]:
+    root = os.path.abspath("StreamHelper/Gametitle")
+    try:
+        relative = os.path.relpath(os.path.abspath(filepath), root).replace("\\", "/")
+    except ValueError:
+        return None
+    parts = relative.split("/", 1)
+    if relative.startswith("..") or len(parts) < 2:
+        return None
+    return parts[0], parts[1]
+
+def mark_saved(filepath: str):
+    # アプリで保存したファイルは開いているパックより優先し、パックにない新しい記録も一覧に出す
+    found = gametitle_entry(filepath)
+    if found is None:
+        return
+    title, entry = found
+    SAVED_ENTRIES.setdefault(title, set()).add(entry)
+    pack = PACKS.get(title)
+    if pack is not None and entry in pack:
+        pack.overrides.add(entry)
+
+def close_pack(title: str):
+    pack = PACKS.pop(title, None)
+    if pack is not None:
+        pack.close()
+
+def build_pack(title: str) -> str:
+    root = f"StreamHelper/Gametitle/{title}"
+    payloads = {}
+    stamps = {}
+    characters = [name for name in os.listdir(f"{root}/Character") if os.path.isdir(f"{root}/Character/{name}")]
+    for name in characters:
+        for file_name in os.listdir(f"{root}/Character/{name}"):
+            with open(f"{root}/Character/{name}/{file_name}", "rb") as f:
+                payloads[f"Character/{name}/{file_name}"] = (f.read(), os.path.splitext(file_name)[1][1:].upper())
+                stamps[f"Character/{name}/{file_name}"] = os.fstat(f.fileno()).st_mtime_ns
+    records = {}
+    for category in ("Player", "Team"):
+        folder = f"{root}/{category}"
+        file_list = os.listdir(folder) if os.path.isdir(folder) else []
+        records[category] = [file_name for file_name in file_list if file_name.endswith(".shd")]
+        for file_name in records[category]:
+            with open(f"{folder}/{file_name}", "rb") as f:
+                payloads[f"{category}/{file_name}"] = (f.read(), "SHD")
+                stamps[f"{category}/{file_name}"] = os.fstat(f.fileno()).st_mtime_ns
+    meta = {
+        "title": title,
+        "characters": characters,
+        "players": records["Player"],
+        "teams": records["Team"],
+        "stamps": stamps
+    }
+    close_pack(title)
+    Container.write_raw(pack_path(title), Container.Container("Pack", meta), payloads)
+    return pack_path(title)
 
 
 class Object:
     def save(self, filepath: str):
-        with open(filepath, "wb") as f:
-            pickle.dump(self.data, f)
+        save(filepath, self.data)
 
     @classmethod
     def load(self, filepath: str) -> dataclass:
-        with open(filepath, "rb") as f:
-            return pickle.load(f)
+        return load(filepath)
 
 
 @dataclass
@@ -56,12 +195,16 @@ class PlayerData:
     title: str = ""
     character: str = ""
     team: str = ""
-    image: Image.Image = None
+    image: Image.Image = Container.ImageField()
+
+    def copy(self):
+        return replace(self)
 
 class Player(Object):
     def __init__(self, title:str):
         self.data = PlayerData()
         self.title = title
+        self._grey: Tuple[Image.Image, Image.Image] = None
         self.change_player_image("StreamHelper/image/face.png")
 
     def __repr__(self):
@@ -69,11 +212,19 @@ class Player(Object):
 
     @classmethod
     def load(cls, filepath: str):
-        data = Object.load(filepath)
+        return cls.from_data(Object.load(filepath))
+
+    @classmethod
+    def from_data(cls, data: PlayerData):
         player = cls(data.title)
         player.data = data
         return player
 
+    def grey_image(self) -> Image.Image:
+        if self._grey is None or self._grey[0] is not self.data.image:
+            self._grey = (self.data.image, grey_image(self.data.image))
+        return self._grey[1]
+
     def load_player_data(self, filepath):
         self.data = super().load(filepath)
 
@@ -93,7 +244,10 @@ class TeamData:
     title: str = ""
     length: int = 1
     player_list: list = field(default_factory=list)
-    image: Image = None
+    image: Image = Container.ImageField()
+
+    def copy(self):
+        return replace(self, player_list=list(self.player_list))
 
 class Team(Object):
     def __init__(self, title: str):
@@ -107,7 +261,10 @@ class Team(Object):
 
     @classmethod
     def load(cls, filepath: str):
-        data = Object.load(filepath)
+        return cls.from_data(Object.load(filepath))
+
+    @classmethod
+    def from_data(cls, data: TeamData):
         team = cls(data.title)
         team.data = data
         return team
@@ -161,7 +318,7 @@ class LayoutData:
     height: Union[int, float] = 0
     position: "list[int]" = field(default_factory=list)
     alpha: int = 255
-    image: Image.Image = None
+    image: Image.Image = Container.ImageField()
     image_list: "dict[Image.Image]" = None
 
 def kw_check(dic: dict):
@@ -176,7 +333,49 @@ def kw_check(dic: dict):
     return dic
 
 
-class LayoutElement:
+# 縮小段を作れるモード。パレット画像などは平均すると色が壊れるので元画像から縮小する
+MIPMAP_MODES = ("RGBA", "RGB", "LA", "L")
+
+
+class TkView:
+    # キャンバス表示用のPhotoImageは表示するときに初めて作る。画像生成はPILだけで完結させる
+    # image_tk はTkスレッドからだけ参照する。描画スレッドでエレメントを作っても Tcl は呼ばれない
+    display_size: Tuple[int] = None
+    _image_tk: "ImageTk.PhotoImage" = None
+    _mipmaps: "list[Image.Image]" = None
+
+    @property
+    def image_tk(self) -> "ImageTk.PhotoImage":
+        if self._image_tk is None:
+            from PIL import ImageTk
+            image = self.image
+            if self.display_size is not None and image.size != self.display_size:
+                # 作り直すのはリサイズ確定時だけなので高品質なフィルタを使う
+                image = self.mipmap(self.display_size).resize(self.display_size, Image.LANCZOS)
+            self._image_tk = ImageTk.PhotoImage(image)
+        return self._image_tk
+
+    def mipmap(self, size: Tuple[int]) -> Image.Image:
+        # 元画像を1/2ずつ縮小した段のうち、表示サイズ以上で一番小さいものを返す。段は必要になったときに作る
+        if self._mipmaps is None or self._mipmaps[0] is not self.image:
+            self._mipmaps = [self.image]
+        if self.image.mode not in MIPMAP_MODES:
+            return self.image
+        index = 0
+        while True:
+            level = self._mipmaps[index]
+            if level.width //2 < max(size[0], 1) or level.height //2 < max(size[1], 1):
+                return level
+            if index +1 == len(self._mipmaps):
+                self._mipmaps.append(level.reduce(2))
+            index += 1
+
+    def set_display_size(self, size: Tuple[int]):
+        self.display_size = tuple(size)
+        self._image_tk = None
+
+
+class LayoutElement(TkView):
     def __init__(self, name: str, category: str, id: str, **kwargs):
         self.name: str = name
         self.category: str = category
@@ -190,6 +389,9 @@ class LayoutElement:
         self.width = kw["width"]
         self.height = kw["height"]
         self.image_list: "dict[Image.Image]" = None
+        # 左右反転した画像とフォントは通常のものと並べて保持し、生成時はどちらかを選ぶだけにする
+        self.variants = Cache.LRUCache(4)
+        self.fonts: "dict[bool, FontData]" = {}
 
     def save_cls(self) -> LayoutData:
         datacls = LayoutData(
@@ -226,7 +428,7 @@ class LayoutElement:
         canvas_size = (960, 540)
         image = Image.new("RGBA", size, (255, 255, 255, 100))
         draw = ImageDraw.Draw(image)
-        font = ImageFont.truetype("StreamHelper\Font\meiryo.ttc", 20)
+        font = load_font("StreamHelper/Font/meiryo.ttc", 20)
         draw.rectangle((0, 0, size[0]-1, size[1]-1),
                         width=5,
                         outline=color
@@ -261,18 +463,37 @@ class LayoutElement:
         self.position = position
 
     def resize(self, size: Tuple[int, int]):
-        image = self.image.copy()
-        image = image.resize(size)
-        self.width, self.height = image.size
-        self.image_tk = ImageTk.PhotoImage(image)
+        self.width, self.height = size
+        self.set_display_size(size)
 
     @classmethod
     def variable_check(cls) -> bool:
         raise NotImplementedError
 
-    def generate_image(self, value: Union[str, Image.Image], mirror: bool=False) -> Image.Image:
+    def generate_image(self, value: Union[str, Image.Image], mirror: bool=False,
+                       size: Tuple[int]=None, resample: int=None) -> Image.Image:
+        # size を省略すると出力キャンバス上の大きさ(width*2, height*2)で生成する
         raise NotImplementedError
 
+    def output_size(self, size: Union[Tuple[int], None]) -> Tuple[int]:
+        return tuple(size) if size else (self.width*2, self.height*2)
+
+    def image_variant(self, source: Image.Image, mirror: bool, size: Tuple[int]=None, resample: int=None) -> Image.Image:
+        key = (id(source), self.output_size(size), resample)
+        variant = self.variants.get(key)
+        if variant is None or variant[0] is not source:
+            variant = (source, {False: source.resize(key[1], resample)})
+            self.variants.set(key, variant)
+        sides = variant[1]
+        if mirror not in sides:
+            sides[mirror] = ImageOps.mirror(sides[False])
+        return sides[mirror]
+
+    def side_font(self, mirror: bool) -> FontData:
+        if mirror not in self.fonts:
+            self.fonts[mirror] = self.font.copy(mirror=mirror)
+        return self.fonts[mirror]
+
 
 class ConstImageLayoutObject(LayoutElement):
     def __init__(self, image_path: str, category: str, id: str, **kwargs):
@@ -280,7 +501,7 @@ class ConstImageLayoutObject(LayoutElement):
         self.cls = "ConstImageLayoutObject"
         if self.image is None:
             self._create_layout_image(image_path)
-            self.image_tk = ImageTk.PhotoImage(self.image)
+            self.set_display_size(self.image.size)
         else:
             self.resize((self.width, self.height))
 
@@ -299,11 +520,9 @@ class ConstImageLayoutObject(LayoutElement):
     def variable_check(cls) -> bool:
         return False
 
-    def generate_image(self, value: Image.Image, mirror: bool=False) -> Image.Image:
-        image = self.image.copy().resize((self.width*2, self.height*2))
-        if mirror:
-            image = ImageOps.mirror(image)
-        return image
+    def generate_image(self, value: Image.Image, mirror: bool=False,
+                       size: Tuple[int]=None, resample: int=None) -> Image.Image:
+        return self.image_variant(self.image, mirror, size, resample)
 
 class VariableImageLayoutObject(LayoutElement):
     def __init__(self, name: str, category: str, id: str, **kwargs):
@@ -311,7 +530,7 @@ class VariableImageLayoutObject(LayoutElement):
         self.cls = "VariableImageLayoutObject"
         if self.image is None:
             self.image = self.create_layout_image()
-            self.image_tk = ImageTk.PhotoImage(self.image)
+            self.set_display_size(self.image.size)
         else:
             self.resize((self.width, self.height))
 
@@ -322,11 +541,9 @@ class VariableImageLayoutObject(LayoutElement):
     def variable_check(cls) -> bool:
         return True
 
-    def generate_image(self, value: Image.Image, mirror: bool=False) -> Image.Image:
-        image = value.copy().resize((self.width*2, self.height*2))
-        if mirror:
-            image = ImageOps.mirror(image)
-        return image
+    def generate_image(self, value: Image.Image, mirror: bool=False,
+                       size: Tuple[int]=None, resample: int=None) -> Image.Image:
+        return self.image_variant(value, mirror, size, resample)
 
 class ConstTextLayoutObject(LayoutElement):
     def __init__(self, name: str, category: str, id: str, **kwargs):
@@ -334,7 +551,7 @@ class ConstTextLayoutObject(LayoutElement):
         self.cls = "ConstTextLayoutObject"
         if self.image is None:
             self.image = self.create_layout_image()
-            self.image_tk = ImageTk.PhotoImage(self.image)
+            self.set_display_size(self.image.size)
         else:
             self.resize((self.width, self.height))
 
@@ -346,9 +563,10 @@ class ConstTextLayoutObject(LayoutElement):
     def variable_check(cls) -> bool:
         return False
 
-    def generate_image(self, value: str, mirror: bool=False) -> Image.Image:
-        font = self.font.copy(mirror=mirror)
-        image = create_text_image(value, font, (self.width*2, self.height*2))
+    def generate_image(self, value: str, mirror: bool=False,
+                       size: Tuple[int]=None, resample: int=None) -> Image.Image:
+        font = self.side_font(mirror)
+        image = cached_text_image(value, font, self.output_size(size), resample)
         return image
 
 class VariableTextLayoutObject(LayoutElement):
@@ -357,7 +575,7 @@ class VariableTextLayoutObject(LayoutElement):
         self.cls = "VariableTextLayoutObject"
         if self.image is None:
             self.image = self.create_layout_image()
-            self.image_tk = ImageTk.PhotoImage(self.image)
+            self.set_display_size(self.image.size)
         else:
             self.resize((self.width, self.height))
 
@@ -368,9 +586,10 @@ class VariableTextLayoutObject(LayoutElement):
     def variable_check(cls) -> bool:
         return True
 
-    def generate_image(self, value: str, mirror: bool=False) -> Image.Image:
-        font = self.font.copy(mirror=mirror)
-        image = create_text_image(value, font, (self.width*2, self.height*2))
+    def generate_image(self, value: str, mirror: bool=False,
+                       size: Tuple[int]=None, resample: int=None) -> Image.Image:
+        font = self.side_font(mirror)
+        image = cached_text_image(value, font, self.output_size(size), resample)
         return image
 
 class CounterTextLayoutObject(LayoutElement):
@@ -379,7 +598,7 @@ class CounterTextLayoutObject(LayoutElement):
         self.cls = "CounterTextLayoutObject"
         if self.image is None:
             self.image = self.create_layout_image()
-            self.image_tk = ImageTk.PhotoImage(self.image)
+            self.set_display_size(self.image.size)
         else:
             self.resize((self.width, self.height))
 
@@ -390,9 +609,10 @@ class CounterTextLayoutObject(LayoutElement):
     def variable_check(cls) -> bool:
         return True
 
-    def generate_image(self, value: str, mirror: bool=False) -> Image.Image:
-        font = self.font.copy(mirror=mirror)
-        image = create_text_image(value, font, (self.width*2, self.height*2))
+    def generate_image(self, value: str, mirror: bool=False,
+                       size: Tuple[int]=None, resample: int=None) -> Image.Image:
+        font = self.side_font(mirror)
+        image = cached_text_image(value, font, self.output_size(size), resample)
         return image
 
 class CounterImageLayoutObject(LayoutElement):
@@ -401,11 +621,13 @@ class CounterImageLayoutObject(LayoutElement):
         self.cls = "CounterImageLayoutObject"
         if self.image is None:
             self.image = self.create_layout_image()
-            self.image_tk = ImageTk.PhotoImage(self.image)
+            self.set_display_size(self.image.size)
         else:
             self.resize((self.width, self.height))
         if folder_path:
             self.image_list = {os.path.splitext(path)[0]: Image.open(f"{folder_path}/{path}") for path in os.listdir(folder_path)}
+        self.atlas: "dict[Tuple[str, bool], Image.Image]" = {}
+        self.atlas_size: Tuple[Tuple[int], int] = None
 
     def create_layout_image(self):
         return super().create_layout_image((100, 100), "yellow", self.category, self.name)
@@ -425,11 +647,21 @@ class CounterImageLayoutObject(LayoutElement):
     def variable_check(cls) -> bool:
         return True
 
-    def generate_image(self, value: Image.Image, mirror: bool=False) -> Image.Image:
-        image = value.copy().resize((self.width*2, self.height*2))
-        if mirror:
-            image = ImageOps.mirror(image)
-        return image
+    def create_atlas(self, size: Tuple[int], resample: int=None):
+        self.atlas = {}
+        for key, image in self.image_list.items():
+            image = image.convert("RGBA") if image.mode != "RGBA" else image
+            self.atlas[(key, False)] = image.resize(size, resample)
+        self.atlas_size = (size, resample)
+
+    def generate_image(self, value: str, mirror: bool=False,
+                       size: Tuple[int]=None, resample: int=None) -> Image.Image:
+        size = self.output_size(size)
+        if self.atlas_size != (size, resample):
+            self.create_atlas(size, resample)
+        if (value, mirror) not in self.atlas:
+            self.atlas[(value, mirror)] = ImageOps.mirror(self.atlas[(value, False)])
+        return self.atlas[(value, mirror)]
 
 UNION_OBJECT = Union[
     ConstTextLayoutObject,
@@ -458,12 +690,13 @@ def layout_element_check(element: Union[LayoutData, str]) -> UNION_OBJECT:
 
 
 
-class LayoutCollection:
+class LayoutCollection(TkView):
     def __init__(self, init_list: "list[LayoutData]", id: str, name: str):
         self.name = name
         self.list: "list[LayoutData]" = init_list
         self.mirror = False
-        self.image = self.create_image()
+        self.previews: "dict[bool, Image.Image]" = {}
+        self.image = self.preview()
         self.width, self.height = self.image.size
         canvas_size = (960, 540)
         self.position: "list[int]" = [
@@ -473,7 +706,7 @@ class LayoutCollection:
             canvas_size[1] /2 + self.height /2,
         ]
         self.id = id
-        self.image_tk = ImageTk.PhotoImage(self.image)
+        self.set_display_size(self.image.size)
 
     def debug_list_print(self) -> str:
         return_list = [data.__repr__() for data in self.list]
@@ -489,6 +722,11 @@ class LayoutCollection:
         ]
         return "\n".join(return_list)
 
+    def preview(self) -> Image.Image:
+        if self.mirror not in self.previews:
+            self.previews[self.mirror] = self.create_image()
+        return self.previews[self.mirror]
+
     def create_image(self):
         max_x = max([obj.position[2] for obj in self.list])
         image = Image.new("RGBA", (960, 540), (255, 255, 255, 0))
@@ -503,24 +741,145 @@ class LayoutCollection:
 
     def size_update(self, size: Tuple[int]):
         self.width, self.height = size
-        image = self.image.copy().resize((self.width, self.height))
-        self.image_tk = ImageTk.PhotoImage(image)
+        self.set_display_size((self.width, self.height))
 
     def mirror_update(self):
         self.mirror = not self.mirror
-        self.image = self.create_image()
-        image = self.image.copy().resize((self.width, self.height))
-        self.image_tk = ImageTk.PhotoImage(image)
+        self.image = self.preview()
+        self.set_display_size((self.width, self.height))
+
+    def snapshot(self) -> LayoutSnapshot:
+        return LayoutSnapshot(self.id, tuple(self.list), self.mirror, self.width, self.height, tuple(self.position))
+
+
+@dataclass(frozen=True)
+class LayoutSnapshot:
+    # 描画スレッドに渡すコレクションの写し。Tkスレッドで作り、描画中にGUIで変更されても影響を受けない
+    id: str
+    list: "tuple[LayoutData]"
+    mirror: bool
+    width: int
+    height: int
+    position: "tuple[int]"
+
+
+UNION_COLLECTION = Union[LayoutCollection, LayoutSnapshot]
 
 
 def save(filepath, data):
-    with open(filepath, "wb") as f:
-        pickle.dump(data, f)
+    container, images = to_container(data)
+    Container.write(filepath, container, images)
 
 def load(filepath):
+    if Container.is_container(filepath):
+        return from_container(Container.read(filepath))
     with open(filepath, "rb") as f:
         return pickle.load(f)
 
+def loads(data: bytes):
+    if data[:len(Container.MAGIC)] == Container.MAGIC:
+        return from_container(Container.read_bytes(data))
+    return pickle.loads(data)
+
+def migrate(filepath: str) -> bool:
+    if Container.is_container(filepath):
+        return False
+    with open(filepath, "rb") as f:
+        data = pickle.load(f)
+    save(filepath, data)
+    return True
+
+def to_container(data: Union[PlayerData, TeamData, "list[LayoutData]", "dict[str, LayoutCollection]"]) -> Tuple[Container.Container, "dict[str, Image.Image]"]:
+    if isinstance(data, PlayerData):
+        meta = {
+            "name": data.name,
+            "title": data.title,
+            "character": data.character,
+            "team": data.team
+        }
+        return Container.Container("Player", meta), {"image": data.image}
+    if isinstance(data, TeamData):
+        meta = {
+            "name": data.name,
+            "title": data.title,
+            "length": data.length,
+            "player_list": data.player_list
+        }
+        return Container.Container("Team", meta), {"image": data.image}
+    if isinstance(data, dict):
+        collections, images = [], {}
+        for index, collection in enumerate(data.values()):
+            layouts, layout_images = layouts_to_meta(collection.list, f"{index}/")
+            collections.append({
+                "id": collection.id,
+                "name": collection.name,
+                "position": list(collection.position),
+                "width": collection.width,
+                "height": collection.height,
+                "mirror": collection.mirror,
+                "layouts": layouts
+            })
+            images.update(layout_images)
+        return Container.Container("StreamLayout", {"collections": collections}), images
+    layouts, images = layouts_to_meta(data)
+    return Container.Container("LayoutObject", {"layouts": layouts}), images
+
+def layouts_to_meta(data: "list[LayoutData]", prefix: str="") -> Tuple[list, "dict[str, Image.Image]"]:
+    layouts, images = [], {}
+    for index, layout in enumerate(data):
+        layouts.append({
+            "name": layout.name,
+            "category": layout.category,
+            "id": layout.id,
+            "cls": layout.cls,
+            "font": asdict(layout.font),
+            "width": layout.width,
+            "height": layout.height,
+            "position": list(layout.position),
+            "alpha": layout.alpha,
+            "image_list": list(layout.image_list.keys()) if layout.image_list is not None else None
+        })
+        images[f"{prefix}{index}/image"] = layout.image
+        if layout.image_list is not None:
+            images.update({f"{prefix}{index}/image_list/{key}": image for key, image in layout.image_list.items()})
+    return layouts, images
+
+def from_container(container: Container.Container) -> Union[PlayerData, TeamData, "list[LayoutData]", "dict[str, LayoutCollection]"]:
+    if container.kind == "Player":
+        data = PlayerData(**container.meta)
+        data.image = container.image("image")
+        return data
+    if container.kind == "Team":
+        data = TeamData(**container.meta)
+        data.image = container.image("image")
+        return data
+    if container.kind == "LayoutObject":
+        return layouts_from_meta(container, container.meta["layouts"])
+    if container.kind == "StreamLayout":
+        collections = {}
+        for index, meta in enumerate(container.meta["collections"]):
+            collection = LayoutCollection(layouts_from_meta(container, meta["layouts"], f"{index}/"), meta["id"], meta["name"])
+            if meta["mirror"]:
+                collection.mirror_update()
+            collection.position = meta["position"]
+            collection.size_update((meta["width"], meta["height"]))
+            collections[collection.id] = collection
+        return collections
+    raise Container.ContainerError(f"未対応のデータです: {container.kind}")
+
+def layouts_from_meta(container: Container.Container, metas: "list[dict]", prefix: str="") -> "list[LayoutData]":
+    layouts = []
+    for index, meta in enumerate(metas):
+        meta = dict(meta)
+        keys = meta.pop("image_list")
+        layout = LayoutData(**meta)
+        layout.font = FontData(**meta["font"])
+        layout.image = container.image(f"{prefix}{index}/image")
+        if keys is not None:
+            layout.image_list = {key: container.image(f"{prefix}{index}/image_list/{key}").decode() for key in keys}
+        layouts.append(layout)
+    return layouts
+
 def anchor_width(anchor: str, width: int, paste_width: int) -> int:
     if anchor == "中央":
         return int(width /2 - paste_width /2)
@@ -529,8 +888,19 @@ def anchor_width(anchor: str, width: int, paste_width: int) -> int:
     elif anchor == "右寄":
         return width - paste_width
 
-def create_text_image(text: str, font: FontData, size: Union[Tuple[int], bool]=False):
-    _font = ImageFont.truetype(f"StreamHelper/Font/{font.font}", 100)
+FONT_CACHE = Cache.LRUCache(32)
+
+def load_font(path: str, size: int, index: int=0) -> ImageFont.FreeTypeFont:
+    # FreeTypeFontはスレッド間で共有できないので、スレッドごとに別のフォントを持つ
+    key = (os.path.normcase(os.path.abspath(path)), size, index, threading.get_ident())
+    font = FONT_CACHE.get(key)
+    if font is None:
+        font = ImageFont.truetype(path, size, index=index)
+        FONT_CACHE.set(key, font)
+    return font
+
+def create_text_image(text: str, font: FontData, size: Union[Tuple[int], bool]=False, resample: int=None):
+    _font = load_font(f"StreamHelper/Font/{font.font}", 100)
     _size = ImageDraw.Draw(Image.new("RGBA", (1, 1), (255, 255, 255, 100))).textsize(text, _font)
     _size = (_size[0] +font.stroke_width*2, _size[1] +font.stroke_width*2)
     text_image = Image.new("RGBA", _size, (255, 255, 255, 0))
@@ -545,14 +915,28 @@ def create_text_image(text: str, font: FontData, size: Union[Tuple[int], bool]=F
         anchor="mm"
         )
     if size:
-        text_image.thumbnail(size)
+        if resample is None:
+            text_image.thumbnail(size)
+        else:
+            text_image.thumbnail(size, resample)
         return_image = Image.new("RGBA", size, (255, 255, 255, 0))
         w = anchor_width(font.anchor, size[0], text_image.size[0])
         return_image.paste(text_image, (w, 0), mask=text_image)
         return return_image
     return text_image
 
-def image_tk(image: Image.Image) -> ImageTk.PhotoImage:
+TEXT_IMAGE_CACHE = Cache.LRUCache(Cache.megabyte(32), Cache.image_size)
+
+def cached_text_image(text: str, font: FontData, size: Union[Tuple[int], bool]=False, resample: int=None) -> Image.Image:
+    key = (text, astuple(font), tuple(size) if size else size, resample)
+    image = TEXT_IMAGE_CACHE.get(key)
+    if image is None:
+        image = create_text_image(text, font, size, resample)
+        TEXT_IMAGE_CACHE.set(key, image)
+    return image
+
+def image_tk(image: Image.Image) -> "ImageTk.PhotoImage":
+    from PIL import ImageTk
     return ImageTk.PhotoImage(image)
 
 def color_reverse(color_code: str):
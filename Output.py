@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from typing import Union, Tuple
+from dataclasses import dataclass
+import os
+import io
+import time
+import struct
+from multiprocessing import shared_memory
+from PIL import Image
+
+# tga/bmpは無圧縮。32bit BMPのアルファは読み込み側で無視されることがあるため透過が必要ならtgaを使う
+# qoiはQOIの書き込みに対応したPillowでのみ使用できる
+OUTPUT_FORMATS = {
+    "png": "PNG",
+    "tga": "TGA",
+    "bmp": "BMP",
+    "qoi": "QOI"
+}
+
+
+@dataclass
+class OutputTiming:
+    encode: float = 0.0
+    write: float = 0.0
+    size: int = 0
+
+    def __add__(self, other: "OutputTiming") -> "OutputTiming":
+        return OutputTiming(self.encode +other.encode, self.write +other.write, self.size +other.size)
+
+    def __str__(self) -> str:
+        return f"encode {self.encode *1000:.0f}ms / write {self.write *1000:.0f}ms / {self.size /1024:.0f}KB"
+
+
+class OutputWriter:
+    def __init__(self, format: str="png", compress_level: int=1):
+        self.format = format.lower()
+        if self.format not in OUTPUT_FORMATS:
+            raise ValueError(f"未対応の出力形式です: {format}")
+        Image.init()
+        if OUTPUT_FORMATS[self.format] not in Image.SAVE:
+            raise ValueError(f"このPillowでは{OUTPUT_FORMATS[self.format]}形式で保存できません")
+        self.compress_level = compress_level
+
+    def encode(self, image: Image.Image) -> bytes:
+        buffer = io.BytesIO()
+        if self.format == "png":
+            image.save(buffer, format="PNG", compress_level=self.compress_level)
+        elif self.format == "tga":
+            image.save(buffer, format="TGA", rle=False)
+        else:
+            image.save(buffer, format=OUTPUT_FORMATS[self.format])
+        return buffer.getvalue()
+
+    def write(self, image: Image.Image, filepath: str) -> OutputTiming:
+        start = time.perf_counter()
+        data = self.encode(image)
+        encoded = time.perf_counter()
+        write_atomic(filepath, data)
+        return OutputTiming(encoded -start, time.perf_counter() -encoded, len(data))
+
+
+class RenderTarget:
+    def __init__(self, path: str, rect: Tuple[int]=(0, 0, 1920, 1080), scale: float=1.0,
+                 format: str="png", compress_level: int=1):
+        self.path = path
+        self.rect = tuple(rect)
+        self.scale = scale
+        self.writer = OutputWriter(format, compress_level)
+
+    @property
+    def size(self) -> Tuple[int]:
+        return (max(round((self.rect[2] -self.rect[0]) *self.scale), 1),
+                max(round((self.rect[3] -self.rect[1]) *self.scale), 1))
+
+    def is_dirty(self, rects: "list[Tuple[int]]") -> bool:
+        if not os.path.exists(self.path):
+            return True
+        for rect in rects:
+            if rect[0] < self.rect[2] and self.rect[0] < rect[2] and rect[1] < self.rect[3] and self.rect[1] < rect[3]:
+                return True
+        return False
+
+    def render(self, image: Image.Image) -> Image.Image:
+        if self.rect != (0, 0, image.width, image.height):
+            image = image.crop(self.rect)
+        if self.scale != 1.0:
+            # 縮小はBOXで十分きれいで速い
+            image = image.resize(self.size, Image.BOX if self.scale < 1.0 else Image.BICUBIC)
+        return image
+
+    def write(self, image: Image.Image, filepath: str="") -> OutputTiming:
+        start = time.perf_counter()
+        image = self.render(image)
+        timing = self.writer.write(image, filepath or self.path)
+        timing.encode += time.perf_counter() -start -timing.encode -timing.write
+        return timing
+
+
+def write_atomic(filepath: str, data: Union[bytes, memoryview], retry: int=5):
+    temp_path = f"{filepath}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(data)
+    # OBSが読み込み中だとWindowsではリネームが一時的に失敗するため少し待って再試行する
+    for count in range(retry):
+        try:
+            os.replace(temp_path, filepath)
+            return
+        except PermissionError:
+            if count == retry -1:
+                raise
+            time.sleep(0.01)
+
+
+# 共有メモリのレイアウト
+# [MAGIC 4byte][VERSION uint16][予約 uint16][幅 uint32][高さ uint32][stride uint32][形式 4byte][シーケンス番号 uint64][RGBA画素]
+# シーケンス番号は書き込み中は奇数、書き込み完了で偶数になる。読み込み側は前後で番号が一致し偶数のときだけ採用する
+SHARED_MEMORY_MAGIC = b"SHMF"
+SHARED_MEMORY_VERSION = 1
+SHARED_MEMORY_HEADER = struct.Struct("<4sHHIII4sQ")
+SEQUENCE_OFFSET = SHARED_MEMORY_HEADER.size -8
+
+
+class SharedMemoryOutput:
+    def __init__(self, name: str, size: Tuple[int]=(1920, 1080)):
+        self.name = name
+        self.width, self.height = size
+        self.stride = self.width *4
+        self.sequence = 0
+        length = SHARED_MEMORY_HEADER.size +self.stride *self.height
+        try:
+            self.memory = shared_memory.SharedMemory(name=name, create=True, size=length)
+        except FileExistsError:
+            self.memory = self.attach(name, length)
+        SHARED_MEMORY_HEADER.pack_into(self.memory.buf, 0, SHARED_MEMORY_MAGIC, SHARED_MEMORY_VERSION, 0,
+                                       self.width, self.height, self.stride, b"RGBA", self.sequence)
+
+    def attach(self, name: str, length: int) -> shared_memory.SharedMemory:
+        # 前回の起動で作った共有メモリが残っている場合。読み込み側が同じ番号のフレームを最新と見なさないよう、番号は引き継ぐ
+        memory = shared_memory.SharedMemory(name=name)
+        if memory.size >= length:
+            magic, _, _, _, _, _, _, sequence = SHARED_MEMORY_HEADER.unpack_from(memory.buf, 0)
+            if magic == SHARED_MEMORY_MAGIC:
+                self.sequence = sequence +sequence %2
+            return memory
+        # 小さすぎる場合は作り直す。Windowsでは読み込み側が開いている間は削除されないので、その場合はエラーにする
+        memory.close()
+        try:
+            memory.unlink()
+        except FileNotFoundError:
+            pass
+        try:
+            return shared_memory.SharedMemory(name=name, create=True, size=length)
+        except FileExistsError:
+            raise FileExistsError(f"共有メモリ {name} が出力サイズより小さく、作り直せません。OBSのソースを閉じてから再度開いてください")
+
+    def publish(self, image: Image.Image, rects: "list[Tuple[int]]"=None) -> OutputTiming:
+        start = time.perf_counter()
+        if image.mode != "RGBA":
+            image = image.convert("RGBA")
+        self.set_sequence(self.sequence +1)
+        if rects is None:
+            rects = [(0, 0, self.width, self.height)]
+        size = 0
+        for rect in rects:
+            data = image.crop(rect).tobytes()
+            row = (rect[2] -rect[0]) *4
+            for y in range(rect[1], rect[3]):
+                offset = SHARED_MEMORY_HEADER.size +y *self.stride +rect[0] *4
+                source = (y -rect[1]) *row
+                self.memory.buf[offset:offset +row] = data[source:source +row]
+            size += len(data)
+        self.set_sequence(self.sequence +1)
+        return OutputTiming(0.0, time.perf_counter() -start, size)
+
+    def set_sequence(self, sequence: int):
+        self.sequence = sequence
+        struct.pack_into("<Q", self.memory.buf, SEQUENCE_OFFSET, sequence)
+
+    def close(self):
+        self.memory.close()
+        try:
+            self.memory.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class SharedMemoryReader:
+    def __init__(self, name: str):
+        self.memory = shared_memory.SharedMemory(name=name)
+        self.sequence = 0
+
+    def header(self) -> tuple:
+        return SHARED_MEMORY_HEADER.unpack_from(self.memory.buf, 0)
+
+    def read(self, retry: int=10) -> Union[Tuple[int, Image.Image], None]:
+        for _ in range(retry):
+            magic, _, _, width, height, stride, _, before = self.header()
+            if magic != SHARED_MEMORY_MAGIC:
+                return None
+            if before %2:
+                continue
+            data = bytes(self.memory.buf[SHARED_MEMORY_HEADER.size:SHARED_MEMORY_HEADER.size +stride *height])
+            after = self.header()[-1]
+            if before == after:
+                self.sequence = after
+                return after, Image.frombuffer("RGBA", (width, height), data, "raw", "RGBA", stride, 1)
+        return None
+
+    def close(self):
+        self.memory.close()
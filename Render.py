@@ -0,0 +1,516 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from typing import Union, Tuple
+import os
+import threading
+import configparser
+from dataclasses import dataclass
+from PIL import Image
+import Object as Obj
+import Cache
+import Container
+import Output
+
+# 画像生成の本体。tkinterに依存しないので、ワーカープロセスやコマンドラインからも使える
+CANVAS_SIZE = (1920, 1080)
+CANVAS_RECT = (0, 0, *CANVAS_SIZE)
+RESAMPLE_FILTERS = {
+    "nearest": Image.NEAREST,
+    "box": Image.BOX,
+    "bilinear": Image.BILINEAR,
+    "hamming": Image.HAMMING,
+    "bicubic": Image.BICUBIC,
+    "lanczos": Image.LANCZOS
+}
+
+
+@dataclass
+class ManagerSetting:
+    character_image_file_name :str = ""
+    output_name: str = ""
+    layer_cache_size: int = 0
+    output_format: str = ""
+    png_compress_level: int = 0
+    output_mode: str = ""
+    shared_memory_name: str = ""
+    output_targets: "list[dict]" = None
+    single_resample: bool = True
+    resample_filter: str = ""
+
+    def __init__(self):
+        self.setting_ini = configparser.ConfigParser()
+        setting_ini_path = "StreamHelper/Setting.ini"
+        self.setting_ini.read(setting_ini_path, encoding="utf-8")
+        self.setting = self.setting_ini["USER_SETTING"]
+        self.load()
+
+    def load(self):
+        self.character_image_file_name = self.setting["character_image_file_name"]
+        self.output_name = self.setting["output_name"]
+        self.layer_cache_size = self.setting.getint("layer_cache_size")
+        self.output_format = self.setting["output_format"]
+        self.png_compress_level = self.setting.getint("png_compress_level")
+        self.output_mode = self.setting["output_mode"]
+        self.shared_memory_name = self.setting["shared_memory_name"]
+        self.single_resample = self.setting.getboolean("single_resample")
+        self.resample_filter = self.setting["resample_filter"].lower()
+        if self.resample_filter not in RESAMPLE_FILTERS:
+            raise ValueError(f"未対応のリサンプリングフィルターです: {self.resample_filter}")
+        self.output_targets = []
+        # [OUTPUT_名前] セクションごとに追加の出力先を読み込む
+        for section_name in self.setting_ini.sections():
+            if not section_name.startswith("OUTPUT_"):
+                continue
+            section = self.setting_ini[section_name]
+            self.output_targets.append({
+                "path": section["path"],
+                "rect": tuple(int(v) for v in section.get("crop", "0, 0, 1920, 1080").split(",")),
+                "scale": section.getfloat("scale", 1.0),
+                "format": section.get("format", self.output_format)
+            })
+
+    def save(self):
+        with open("Sample.ini", "w") as configfile:
+            self.setting_ini.write(configfile)
+
+
+class RecordStore:
+    def __init__(self):
+        self.records: "dict[str: Tuple[int, Union[Obj.Player, Obj.Team]]]" = {}
+
+    def key(self, filepath: str) -> str:
+        return os.path.normcase(os.path.abspath(filepath))
+
+    def stamp(self, filepath: str) -> Union[int, None]:
+        try:
+            return os.stat(filepath).st_mtime_ns
+        except OSError:
+            return None
+
+    def load(self, cls: "type[Union[Obj.Player, Obj.Team]]", filepath: str) -> Union[Obj.Player, Obj.Team]:
+        key = self.key(filepath)
+        stamp = self.stamp(filepath)
+        record = self.records.get(key)
+        if record is not None and record[0] == stamp and isinstance(record[1], cls):
+            return record[1]
+        data = cls.load(filepath)
+        self.records[key] = (stamp, data)
+        return data
+
+    def packed(self, title: str, category: str, name: str) -> Union[Container.Pack, None]:
+        return Obj.packed_entry(title, f"{category}/{name}.shd")
+
+    def load_record(self, cls: "type[Union[Obj.Player, Obj.Team]]", title: str, category: str, name: str) -> Union[Obj.Player, Obj.Team]:
+        filepath = self.path(title, category, name)
+        pack = self.packed(title, category, name)
+        if pack is None:
+            return self.load(cls, filepath)
+        key = self.key(filepath)
+        record = self.records.get(key)
+        if record is not None and record[0] == pack.stamp and isinstance(record[1], cls):
+            return record[1]
+        data = cls.from_data(Obj.loads(pack.read(f"{category}/{name}.shd")))
+        self.records[key] = (pack.stamp, data)
+        return data
+
+    def record_stamp(self, title: str, category: str, name: str) -> Union[int, None]:
+        pack = self.packed(title, category, name)
+        if pack is None:
+            return self.stamp(self.path(title, category, name))
+        return pack.stamp
+
+    def path(self, title: str, category: str, name: str) -> str:
+        return f"StreamHelper/Gametitle/{title}/{category}/{name}.shd"
+
+    def player(self, title: str, name: str) -> Obj.Player:
+        return self.load_record(Obj.Player, title, "Player", name)
+
+    def team(self, title: str, name: str) -> Obj.Team:
+        return self.load_record(Obj.Team, title, "Team", name)
+
+    def player_stamp(self, title: str, name: str) -> Union[int, None]:
+        return self.record_stamp(title, "Player", name)
+
+    def team_stamp(self, title: str, name: str) -> Union[int, None]:
+        return self.record_stamp(title, "Team", name)
+
+    def invalidate(self, filepath: str=""):
+        if filepath:
+            self.records.pop(self.key(filepath), None)
+            Obj.mark_saved(filepath)
+        else:
+            self.records = {}
+
+
+class RenderContext:
+    # ImageGeneratorに渡す設定・ゲームタイトル・レコードの組。GUIではManagerがこの役割を持つ
+    def __init__(self, title: str, setting: ManagerSetting=None):
+        self.setting = setting if setting is not None else ManagerSetting()
+        self.records = RecordStore()
+        self.game = Obj.GameTitle(title)
+
+
+@dataclass
+class CollectionLayer:
+    state: tuple
+    image: Image.Image
+    box: Tuple[int]
+
+    def rect(self) -> Tuple[int]:
+        return (self.box[0], self.box[1], self.box[0] +self.image.width, self.box[1] +self.image.height)
+
+
+class ImageGenerator:
+    def __init__(self, context: RenderContext):
+        self.context = context
+        self.value_dic = {}
+        self.layout_dic: "dict[str: Obj.UNION_COLLECTION]" = {}
+        # 出力用のキャンバスは1枚だけ確保し、生成のたびに変化した範囲だけ描き直す
+        self.image: Image.Image = Image.new("RGBA", CANVAS_SIZE, (255, 255, 255, 0))
+        self.redraw = True
+        self.layers: "dict[str: CollectionLayer]" = {}
+        self.layer_cache = Cache.LRUCache(Cache.megabyte(self.context.setting.layer_cache_size), Cache.image_size)
+        self.elements: "dict[Tuple[str, str]: Obj.UNION_OBJECT]" = {}
+        self.element_boxes: "dict[Tuple[str, str]: dict[bool, Tuple[int]]]" = {}
+        self.opacity_cache = Cache.LRUCache(Cache.megabyte(32), opacity_size)
+        self.lock = threading.RLock()
+        setting = self.context.setting
+        self.targets = [Output.RenderTarget(f"StreamHelper/{setting.output_name}", format=setting.output_format,
+                                            compress_level=setting.png_compress_level)]
+        for target in setting.output_targets:
+            self.targets.append(Output.RenderTarget(f"StreamHelper/{target['path']}", target["rect"], target["scale"],
+                                                    target["format"], setting.png_compress_level))
+        self.shared_memory: Union[Output.SharedMemoryOutput, None] = None
+        if self.context.setting.output_mode in ("shared_memory", "both"):
+            self.shared_memory = Output.SharedMemoryOutput(self.context.setting.shared_memory_name)
+
+    def reset(self):
+        self.redraw = True
+        self.layers = {}
+        self.layer_cache.clear()
+        self.opacity_cache.clear()
+        self.elements = {}
+        self.element_boxes = {}
+
+    def create_image(self, value_dic: dict, layout_dic: "dict[str: Obj.UNION_COLLECTION]") -> Union[Output.OutputTiming, None]:
+        with self.lock:
+            return self.render(value_dic, layout_dic)
+
+    def render(self, value_dic: dict, layout_dic: "dict[str: Obj.UNION_COLLECTION]") -> Union[Output.OutputTiming, None]:
+        return self.output(self.compose(value_dic, layout_dic))
+
+    def compose(self, value_dic: dict, layout_dic: "dict[str: Obj.UNION_COLLECTION]") -> "list[Tuple[int]]":
+        self.value_dic = value_dic
+        self.layout_dic = layout_dic
+        if self.redraw or list(self.layers.keys()) != list(self.layout_dic.keys()):
+            self.redraw = False
+            self.layers = {}
+            dirty = [CANVAS_RECT]
+        else:
+            dirty = []
+        layers = {}
+        for id, collection in self.layout_dic.items():
+            state = self.layer_state(collection)
+            old = self.layers.get(id)
+            if old is not None and old.state == state:
+                layers[id] = old
+                continue
+            patch = self.patch_layout(collection, old, state)
+            if patch is not None:
+                layers[id] = CollectionLayer(state, patch[0], old.box)
+                dirty += patch[1]
+                continue
+            img = self.generate_layout(collection)
+            layers[id] = CollectionLayer(state, img, self.get_box(False, collection))
+            if old is not None:
+                dirty.append(old.rect())
+            dirty.append(layers[id].rect())
+        self.layers = layers
+        rects = [intersect_rects(rect, CANVAS_RECT) for rect in merge_rects(dirty)]
+        rects = [rect for rect in rects if rect is not None]
+        for rect in rects:
+            self.composite(rect)
+        return rects
+
+    def output(self, rects: "list[Tuple[int]]") -> Union[Output.OutputTiming, None]:
+        # 合成は1回だけ行い、各出力先は変化した範囲と重なる場合だけ切り出して書き出す
+        # ファイル出力は変化が小さくても画像全体をエンコードし直すので、差分更新の時間はPNGのエンコード時間より短くならない
+        # (1920x1080で約60ms)。共有メモリ出力は変化した範囲だけを書き込む
+        timing = None
+        if self.context.setting.output_mode in ("file", "both"):
+            for target in self.targets:
+                if target.is_dirty(rects):
+                    target_timing = target.write(self.image)
+                    timing = target_timing if timing is None else timing +target_timing
+        if self.shared_memory is not None and rects:
+            shared_timing = self.shared_memory.publish(self.image, rects)
+            timing = shared_timing if timing is None else timing +shared_timing
+        return timing
+
+    def layer_state(self, collection: Obj.UNION_COLLECTION) -> tuple:
+        return (tuple(collection.position), self.layer_key(collection, self.value_dic[collection.id]))
+
+    def composite(self, rect: Tuple[int]):
+        self.image.paste((255, 255, 255, 0), rect)
+        for layer in self.layers.values():
+            area = intersect_rects(rect, layer.rect())
+            if area is None:
+                continue
+            img = layer.image.crop((area[0] -layer.box[0], area[1] -layer.box[1],
+                                    area[2] -layer.box[0], area[3] -layer.box[1]))
+            self.image.paste(img, area[:2], mask=img)
+
+    def get_value(self, object: Obj.LayoutData, dic: dict, master_key: str="") -> Union[str, Image.Image]:
+        if "Const" in object.cls:
+            return ""
+        else:
+            if object.category == "Team":
+                value = dic[master_key]
+                if "チーム" in object.name:
+                    value = value[master_key]
+                    team = self.context.records.team(self.context.game.title, value)
+                    if "名" in object.name:
+                        return team.data.name
+                    if "画像" in object.name:
+                        return team.data.image
+                else:
+                    check = value[f"check_{object.id}"]
+                    value = value[object.id]
+                    player = self.context.records.player(self.context.game.title, value)
+                    if object.name == "プレイヤー名":
+                        return player.data.name
+                    if object.name == "プレイヤー画像":
+                        if check:
+                            return player.grey_image()
+                        else:
+                            return player.data.image
+                    if object.name == "キャラクター名":
+                        return player.data.character
+                    if object.name == "キャラクター画像":
+                        if check:
+                            return self.context.game.character_image(player.data.character, self.context.setting.character_image_file_name, grey=True)
+                        else:
+                            return self.context.game.character_image(player.data.character, self.context.setting.character_image_file_name)
+            else:
+                value = dic[object.id]
+                if object.category == "Player":
+                    player = self.context.records.player(self.context.game.title, value)
+                    if object.name == "プレイヤー名":
+                        return player.data.name
+                    if object.name == "プレイヤー画像":
+                        return player.data.image
+                    if object.name == "キャラクター名":
+                        return player.data.character
+                    if object.name == "キャラクター画像":
+                        return self.context.game.character_image(player.data.character, self.context.setting.character_image_file_name)
+                if object.category == "Counter":
+                    return value
+
+    def get_element(self, collection: Obj.UNION_COLLECTION, layout: Obj.LayoutData) -> Obj.UNION_OBJECT:
+        key = (collection.id, layout.id)
+        if key not in self.elements:
+            element = Obj.layout_element_check(layout).load_cls(layout)
+            self.elements[key] = element
+            self.element_boxes[key] = {mirror: self.get_box(mirror, element) for mirror in (False, True)}
+        return self.elements[key]
+
+    def element_box(self, collection: Obj.UNION_COLLECTION, layout: Obj.LayoutData) -> Tuple[int]:
+        self.get_element(collection, layout)
+        return self.element_boxes[(collection.id, layout.id)][collection.mirror]
+
+    def get_value_key(self, object: Obj.LayoutData, dic: dict, master_key: str="") -> tuple:
+        records = self.context.records
+        title = self.context.game.title
+        if "Const" in object.cls:
+            return (object.id,)
+        if object.category == "Team":
+            value = dic[master_key]
+            if "チーム" in object.name:
+                return (object.id, value[master_key], records.team_stamp(title, value[master_key]))
+            return (object.id, value[object.id], value[f"check_{object.id}"],
+                    records.player_stamp(title, value[object.id]))
+        if object.category == "Player":
+            return (object.id, dic[object.id], records.player_stamp(title, dic[object.id]))
+        return (object.id, dic[object.id])
+
+    def layer_key(self, collection: Obj.UNION_COLLECTION, values: dict) -> tuple:
+        return (
+            collection.id,
+            collection.mirror,
+            collection.width,
+            collection.height,
+            self.context.game.title,
+            self.context.setting.character_image_file_name,
+            tuple(self.get_value_key(layout, values, collection.id) for layout in collection.list)
+        )
+
+    def generate_layout(self, collection: Obj.UNION_COLLECTION) -> Image.Image:
+        values = self.value_dic[collection.id]
+        key = self.layer_key(collection, values)
+        cache = self.layer_cache.get(key)
+        if cache is not None:
+            return cache
+        if self.context.setting.single_resample:
+            image = self.generate_layout_direct(collection, values)
+        else:
+            image = self.generate_layout_legacy(collection, values)
+        self.layer_cache.set(key, image)
+        return image
+
+    def layout_placements(self, collection: Obj.UNION_COLLECTION) -> "list[Tuple[int]]":
+        # エレメントの配置範囲をコレクションの出力サイズに合わせる変換を求め、collection.list と同じ順に
+        # 各エレメントのレイヤー上の範囲を返す。値には依存しないので、値が変わっても同じ範囲になる
+        size = (collection.width *2, collection.height *2)
+        boxes = []
+        for layout in collection.list:
+            element = self.get_element(collection, layout)
+            box = self.element_box(collection, layout)
+            boxes.append((box[0], box[1], box[0] +element.width *2, box[1] +element.height *2))
+        frame = None
+        for rect in boxes:
+            frame = rect if frame is None else union_rects(frame, rect)
+        frame = intersect_rects(frame, CANVAS_RECT) if frame is not None else None
+        if frame is None:
+            return []
+        scale_x = size[0] /(frame[2] -frame[0])
+        scale_y = size[1] /(frame[3] -frame[1])
+        placements = []
+        for rect in boxes:
+            left = round((rect[0] -frame[0]) *scale_x)
+            top = round((rect[1] -frame[1]) *scale_y)
+            placements.append((left, top, left +max(round((rect[2] -frame[0]) *scale_x) -left, 1),
+                               top +max(round((rect[3] -frame[1]) *scale_y) -top, 1)))
+        return placements
+
+    def generate_layout_direct(self, collection: Obj.UNION_COLLECTION, values: dict) -> Image.Image:
+        # 各エレメントの元画像を最終解像度へ1回だけリサンプリングする
+        image = Image.new("RGBA", (collection.width *2, collection.height *2), (255, 255, 255, 0))
+        self.paint_elements(image, collection, values, self.layout_placements(collection))
+        return image
+
+    def paint_elements(self, image: Image.Image, collection: Obj.UNION_COLLECTION, values: dict,
+                       placements: "list[Tuple[int]]", region: Tuple[int]=None):
+        # region を指定すると、その範囲に掛かるエレメントだけをその範囲に切り抜いて貼り直す
+        resample = RESAMPLE_FILTERS[self.context.setting.resample_filter]
+        for layout, rect in reversed(list(zip(collection.list, placements))):
+            area = rect if region is None else intersect_rects(rect, region)
+            if area is None:
+                continue
+            element_image, mask = self.generate_element(collection, layout, values,
+                                                        (rect[2] -rect[0], rect[3] -rect[1]), resample)
+            if area != rect:
+                crop = (area[0] -rect[0], area[1] -rect[1], area[2] -rect[0], area[3] -rect[1])
+                element_image, mask = element_image.crop(crop), mask.crop(crop)
+            image.paste(element_image, area[:2], mask=mask)
+
+    def patch_layout(self, collection: Obj.UNION_COLLECTION, old: Union[CollectionLayer, None],
+                     state: tuple) -> Union[Tuple[Image.Image, "list[Tuple[int]]"], None]:
+        # 値が変わったエレメントの範囲だけを前回のレイヤーに描き直し、キャンバス上の変化範囲と一緒に返す
+        # 位置・大きさ・反転が変わったときや、新しい状態のレイヤーがキャッシュにあるときはレイヤーごと差し替える
+        if old is None or not self.context.setting.single_resample:
+            return None
+        if old.state[0] != state[0] or old.state[1][:-1] != state[1][:-1] or state[1] in self.layer_cache:
+            return None
+        placements = self.layout_placements(collection)
+        if not placements or len(placements) != len(old.state[1][-1]):
+            return None
+        bounds = (0, 0, old.image.width, old.image.height)
+        image = old.image.copy()
+        values = self.value_dic[collection.id]
+        rects = []
+        for rect, before, after in zip(placements, old.state[1][-1], state[1][-1]):
+            region = intersect_rects(rect, bounds) if before != after else None
+            if region is None:
+                continue
+            image.paste((255, 255, 255, 0), region)
+            self.paint_elements(image, collection, values, placements, region)
+            rects.append((old.box[0] +region[0], old.box[1] +region[1], old.box[0] +region[2], old.box[1] +region[3]))
+        self.layer_cache.set(state[1], image)
+        return image, rects
+
+    def generate_layout_legacy(self, collection: Obj.UNION_COLLECTION, values: dict) -> Image.Image:
+        pastes = []
+        for layout in reversed(collection.list):
+            element_image, mask = self.generate_element(collection, layout, values)
+            pastes.append((element_image, self.element_box(collection, layout), mask))
+        # 全エレメントの範囲だけのバッファに描画する(キャンバス外は従来どおり切り捨てる)
+        bounds = None
+        for element_image, box, _ in pastes:
+            rect = (box[0], box[1], box[0] +element_image.width, box[1] +element_image.height)
+            bounds = rect if bounds is None else union_rects(bounds, rect)
+        bounds = intersect_rects(bounds, CANVAS_RECT) if bounds is not None else None
+        size = (collection.width *2, collection.height *2)
+        if bounds is None:
+            return Image.new("RGBA", size, (255, 255, 255, 0))
+        image = Image.new("RGBA", (bounds[2] -bounds[0], bounds[3] -bounds[1]), (255, 255, 255, 0))
+        for element_image, box, mask in pastes:
+            image.paste(element_image, (box[0] -bounds[0], box[1] -bounds[1]), mask=mask)
+        bbox = image.getbbox()
+        if bbox is None:
+            return Image.new("RGBA", size, (255, 255, 255, 0))
+        return image.crop(bbox).resize(size)
+
+    def generate_element(self, collection: Obj.UNION_COLLECTION, layout: Obj.LayoutData, values: dict,
+                         size: Tuple[int]=None, resample: int=None) -> Tuple[Image.Image, Image.Image]:
+        # 貼り付ける画像とマスクを返す。不透明度を変えるエレメントはアルファをLUTで1回で縮めたマスクをキャッシュする
+        element = self.get_element(collection, layout)
+        if element.alpha != 255:
+            key = (collection.id, layout.id, self.get_value_key(layout, values, collection.id),
+                   collection.mirror, element.alpha, size, resample)
+            cache = self.opacity_cache.get(key)
+            if cache is not None:
+                return cache
+        value = self.get_value(layout, values, collection.id)
+        element_image = element.generate_image(value, collection.mirror, size, resample)
+        if element_image.mode != "RGBA":
+            element_image = element_image.convert("RGBA")
+        if element.alpha == 255:
+            return element_image, element_image
+        cache = (element_image, element_image.getchannel("A").point(opacity_lut(element.alpha)))
+        self.opacity_cache.set(key, cache)
+        return cache
+
+    def get_box(self, mirror: bool, element: Union[Obj.LayoutElement, Obj.UNION_COLLECTION]) -> Tuple[int]:
+        if mirror:
+            x = int(1920 - element.position[0]*2 - element.width*2)
+            y = int(element.position[1]*2)
+            return (x, y)
+        else:
+            return (int(element.position[0]*2), int(element.position[1]*2))
+
+
+OPACITY_LUTS: "dict[int, list[int]]" = {}
+
+def opacity_lut(alpha: int) -> "list[int]":
+    if alpha not in OPACITY_LUTS:
+        OPACITY_LUTS[alpha] = [(value *alpha +127) //255 for value in range(256)]
+    return OPACITY_LUTS[alpha]
+
+def opacity_size(cache: Tuple[Image.Image, Image.Image]) -> int:
+    return Cache.image_size(cache[0]) +Cache.image_size(cache[1])
+
+def intersect_rects(a: Tuple[int], b: Tuple[int]) -> Union[Tuple[int], None]:
+    rect = (max(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2]), min(a[3], b[3]))
+    if rect[0] >= rect[2] or rect[1] >= rect[3]:
+        return None
+    return rect
+
+def union_rects(a: Tuple[int], b: Tuple[int]) -> Tuple[int]:
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+def merge_rects(rects: "list[Tuple[int]]") -> "list[Tuple[int]]":
+    merged = []
+    for rect in rects:
+        rect = tuple(rect)
+        overlap = True
+        while overlap:
+            overlap = False
+            for other in merged:
+                if intersect_rects(rect, other) is not None:
+                    merged.remove(other)
+                    rect = union_rects(rect, other)
+                    overlap = True
+                    break
+        merged.append(rect)
+    return merged
@@ -15,6 +15,21 @@ def get_filename(path: str):
 def random_id(n):
     return str(random.randrange(10**(n-1),10**n))
 
+# リサイズのドラッグ中は枠線だけを動かし、マウスの移動はこの間隔(ms)ごとにまとめて反映する
+RESIZE_INTERVAL = 16
+HANDLE_SIZE = 3
+HANDLE_COLOR = "red"
+HANDLE_CURSORS = {
+    "rect_left_top": "ul_angle",
+    "rect_right_top": "ur_angle",
+    "rect_left_bottom": "ll_angle",
+    "rect_right_bottom": "lr_angle",
+    "rect_top": "sb_v_double_arrow",
+    "rect_bottom": "sb_v_double_arrow",
+    "rect_left": "sb_h_double_arrow",
+    "rect_right": "sb_h_double_arrow"
+}
+
 class ScrollFrame(tk.Frame):
     def __init__(self, parent, *args, **kwargs):
         tk.Frame.__init__(self, parent, *args, **kwargs)
@@ -91,8 +106,8 @@ class ManagerTeamFrame(ManagerChildrenFrame):
         [box.grid(row=index, column=0, pady=2, padx=2) for index, box in enumerate(self.check_list)]
 
     def team_name_select(self):
-        name = f"{self.team_name_box.get()}.shd"
-        self.player_list = [get_filename(player) for player in Obj.Team.load(f"StreamHelper/Gametitle/{self.manager.game.title}/team/{name}").data.player_list]
+        team = self.manager.records.team(self.manager.game.title, self.team_name_box.get())
+        self.player_list = [get_filename(player) for player in team.data.player_list]
         [box.config(values=self.player_list) for box in self.box_list]
 
     def box_select(self):
@@ -126,6 +141,67 @@ class ManagerCounterImageFrame(ManagerChildrenFrame):
 
 
 
+class SelectionHandles:
+    # 選択枠(枠線と8個のハンドル)はキャンバスごとに1回だけ作り、以降は位置の変更と表示/非表示だけを行う
+    def __init__(self, canvas: tk.Canvas, enter: Callable, leave: Callable):
+        self.canvas = canvas
+        self.visible = False
+        self.items: "dict[int: str]" = {}
+        item = canvas.create_rectangle(0, 0, 0, 0, width=2, state="hidden", tag="rect")
+        self.items[item] = "rect"
+        for kind, cursor in HANDLE_CURSORS.items():
+            item = canvas.create_rectangle(0, 0, 0, 0, fill=HANDLE_COLOR, state="hidden", tag=kind)
+            canvas.tag_bind(item, "<Enter>", lambda event, cursor=cursor:enter(cursor))
+            canvas.tag_bind(item, "<Leave>", lambda event:leave())
+            self.items[item] = kind
+
+    def kind(self, item: int) -> Union[str, None]:
+        if self.visible:
+            return self.items.get(item)
+        return None
+
+    def coords(self, bbox) -> "dict[str: tuple]":
+        x_middle = (bbox[0] + bbox[2]) /2
+        y_middle = (bbox[1] + bbox[3]) /2
+        points = {
+            "rect_left_top": (bbox[0], bbox[1]),
+            "rect_right_top": (bbox[2], bbox[1]),
+            "rect_left_bottom": (bbox[0], bbox[3]),
+            "rect_right_bottom": (bbox[2], bbox[3]),
+            "rect_top": (x_middle, bbox[1]),
+            "rect_bottom": (x_middle, bbox[3]),
+            "rect_left": (bbox[0], y_middle),
+            "rect_right": (bbox[2], y_middle)
+        }
+        coords = {"rect": tuple(bbox)}
+        for kind, (x, y) in points.items():
+            coords[kind] = (x -HANDLE_SIZE, y -HANDLE_SIZE, x +HANDLE_SIZE, y +HANDLE_SIZE)
+        return coords
+
+    def place(self, bbox):
+        coords = self.coords(bbox)
+        for item, kind in self.items.items():
+            self.canvas.coords(item, *coords[kind])
+
+    def show(self, bbox):
+        self.place(bbox)
+        for item in self.items:
+            if not self.visible:
+                self.canvas.itemconfigure(item, state="normal")
+            self.canvas.tag_raise(item)
+        self.visible = True
+
+    def hide(self):
+        if self.visible:
+            for item in self.items:
+                self.canvas.itemconfigure(item, state="hidden")
+            self.visible = False
+
+    def move(self, x: int, y: int):
+        for item in self.items:
+            self.canvas.move(item, x, y)
+
+
 class CustomCanvas(tk.Canvas):
     def __init__(self, parent, *args, **kwargs):
         tk.Canvas.__init__(self, parent, *args, **kwargs)
@@ -133,7 +209,16 @@ class CustomCanvas(tk.Canvas):
         self.bind("<Button1-Motion>", lambda event:self.mouse_drag(event))
         self.bind("<ButtonRelease>", lambda event:self.mouse_release())
         self.bind("<Button-3>", lambda event:self.right_click(event))
+        # 要素IDとキャンバスのアイテムIDの対応、選択枠のアイテムを保持し、タグの全件走査をしない
+        self.items: "dict[str: int]" = {}
+        self.item_tags: "dict[int: str]" = {}
+        self.selection = SelectionHandles(self, self.on_mouse_enter, self.on_mouse_leave)
+        self.tag = False
         self.resize_direction = False
+        self.resize_bbox = None
+        self.resize_pos = None
+        self.resize_point = None
+        self.resize_job = None
         self.menu = tk.Menu(self, tearoff=0)
         self.menu.add_command(label="Delete", command=self.delete_object)
 
@@ -143,199 +228,147 @@ class CustomCanvas(tk.Canvas):
     def delete_object(self):
         raise NotImplementedError
 
+    def create_element(self, id: str, x: float, y: float, anchor: str, image) -> int:
+        item = self.create_image(x, y, anchor=anchor, image=image, tag=id)
+        if id in self.items:
+            # 作り直した要素は元の重なり順の位置に置き、全体の並べ直しをしない
+            self.tag_lower(item, self.items[id])
+            self.delete_element(id)
+        self.items[id] = item
+        self.item_tags[item] = id
+        return item
+
+    def delete_element(self, id: str):
+        item = self.items.pop(id, None)
+        if item is not None:
+            del self.item_tags[item]
+            self.delete(item)
+
     def image_move(self, id: str, x: int, y: int):
-        self.move(id, x, y)
+        self.move(self.items[id], x, y)
 
     def image_re_create(self, object: Obj.UNION_OBJECT):
         bbox = self.find_bbox(object.id)
-        self.delete(object.id)
-        self.create_image(
+        self.create_element(
+            object.id,
             (bbox[0] + bbox[2]) /2,
             (bbox[1] + bbox[3]) /2,
             anchor="center",
-            image=object.image_tk,
-            tag=object.id
+            image=object.image_tk
             )
         self.image_select(object.id)
-        self.layer_update()
 
     def image_select(self, image_id):
-        self.rect_delete()
-        self.move_tag_delete()
-        self.tag = (image_id, "current")
-        self.addtag_withtag("move", image_id)
-        self._create_rect(self.find_bbox(image_id))
+        self.tag = (image_id,)
+        self.selection.show(self.find_bbox(image_id))
 
     def mouse_drag(self, event):
         if self.resize_direction:
-            self.resize_rect(event)
+            self.resize_point = (event.x, event.y)
+            if self.resize_job is None:
+                self.resize_job = self.after(RESIZE_INTERVAL, self.resize_preview)
         elif self.tag:
-            self.move(
-                "move",
-                event.x - self.x,
-                event.y - self.y
-                )
+            self.selection_move(event.x - self.x, event.y - self.y)
             self.x = event.x
             self.y = event.y
             self.object_position_update(self.tag[0])
 
-    def resize_rect(self, event):
+    def resize_preview(self):
+        self.resize_job = None
+        if self.resize_bbox is None:
+            self.resize_bbox = self.find_bbox(self.tag[0])
+        pos = self.resize_position(self.resize_bbox, *self.resize_point)
+        if pos:
+            # 画像はそのままにして選択枠だけを新しい大きさに合わせる
+            self.resize_pos = pos
+            self.selection.place(pos)
+
+    def resize_position(self, bbox, x: int, y: int):
+        if self.resize_direction == "rect_top":
+            pos = (bbox[0], y, bbox[2], bbox[3])
+        elif self.resize_direction == "rect_bottom":
+            pos = (bbox[0], bbox[1], bbox[2], y)
+        elif self.resize_direction == "rect_left":
+            pos = (x, bbox[1], bbox[2], bbox[3])
+        elif self.resize_direction == "rect_right":
+            pos = (bbox[0], bbox[1], x, bbox[3])
+        elif self.resize_direction == "rect_left_top":
+            pos = (x, y, bbox[2], bbox[3])
+        elif self.resize_direction == "rect_right_top":
+            pos = (bbox[0], y, x, bbox[3])
+        elif self.resize_direction == "rect_left_bottom":
+            pos = (x, bbox[1], bbox[2], y)
+        elif self.resize_direction == "rect_right_bottom":
+            pos = (bbox[0], bbox[1], x, y)
+        if pos[2] - pos[0] > 5 and pos[3] - pos[1] > 5:
+            return pos
+        return None
+
+    def resize_finish(self):
+        # 最後の移動を反映してから、画像の作り直しはここで1回だけ行う
+        if self.resize_job is not None:
+            self.after_cancel(self.resize_job)
+            self.resize_preview()
+        if self.resize_pos:
+            self.resize_rect(self.resize_pos)
+        self.resize_bbox = None
+        self.resize_pos = None
+        self.resize_point = None
+
+    def resize_rect(self, pos):
         raise NotImplementedError
 
     def object_position_update(self, id: str):
         raise NotImplementedError
 
     def find_tag(self, event):
-        closest_ids = self.find_closest(event.x, event.y)
-        if len(closest_ids) != 0:
-            tag = self.gettags(closest_ids[0])
-            return tag
+        # カーソル下のアイテムを手前から調べ、選択枠なら種類を、要素なら要素IDを返す
+        for item in reversed(self.find_overlapping(event.x, event.y, event.x, event.y)):
+            kind = self.selection.kind(item)
+            if kind:
+                return (kind,)
+            if item in self.item_tags:
+                return (self.item_tags[item],)
         return False
 
-    def tag_get_all(self):
-        ids = self.find_all()
-        tags = [self.gettags(tag) for tag in ids]
-        return tags
-
     def find_bbox(self, name):
-        bbox = self.bbox(name)
+        bbox = self.bbox(self.items.get(name, name))
         return bbox
 
+    def selection_move(self, x: int, y: int):
+        self.move(self.items[self.tag[0]], x, y)
+        self.selection.move(x, y)
+
     def rect_delete(self):
-        tags = self.tag_get_all()
-        for tag in tags:
-            if "rect" in tag[0]:
-                self.delete(tag[0])
+        self.selection.hide()
 
     def resize_check(self, tag):
         if "rect_" in tag[0]:
             self.resize_direction = tag[0]
             return True
         else:
-            self.rect_delete()
             self.resize_direction = False
             return False
 
-    def move_tag_delete(self):
-        tags = self.tag_get_all()
-        for tag in tags:
-            if "move" in tag:
-                self.dtag(tag[0], "move")
-
     def left_click(self, event):
         tag = self.find_tag(event)
-        if tag:
-            if tag[-1] == "current":
-                if not self.resize_check(tag) and tag[0] != "rect":
-                    self.image_select(tag[0])
-                    self.tag = tag
-                    self.x = event.x
-                    self.y = event.y
-            else:
-                self.rect_delete()
-                self.tag = False
+        if not tag:
+            self.rect_delete()
+            self.tag = False
+        elif not self.resize_check(tag):
+            # 選択枠の線をつかんだときは選択中の要素を動かす
+            self.image_select(self.tag[0] if tag[0] == "rect" else tag[0])
+            self.x = event.x
+            self.y = event.y
 
     def right_click(self, event):
         tag = self.find_tag(event)
         if tag:
-            if tag[-1] == "current":
+            if tag[0] in self.items:
                 self.tag = tag
+            if self.tag:
                 self.menu.post(event.x_root, event.y_root)
 
-    def _create_rect(self, bbox):
-        rect_size = 3
-        rect_color = "red"
-        x_middle = (bbox[0] + bbox[2]) /2
-        y_middle = (bbox[1] + bbox[3]) /2
-        self.create_rectangle(
-            bbox[0],
-            bbox[1],
-            bbox[2],
-            bbox[3],
-            width=2,
-            tag=("rect", "move")
-            )
-        left_top = self.create_rectangle(
-            bbox[0] -rect_size,
-            bbox[1] -rect_size,
-            bbox[0] +rect_size,
-            bbox[1] +rect_size,
-            fill=rect_color,
-            tag=(f"rect_left_top", "move")
-            )
-        right_top = self.create_rectangle(
-            bbox[2] -rect_size,
-            bbox[1] -rect_size,
-            bbox[2] +rect_size,
-            bbox[1] +rect_size,
-            fill=rect_color,
-            tag=(f"rect_right_top", "move")
-            )
-        left_bottom = self.create_rectangle(
-            bbox[0] -rect_size,
-            bbox[3] -rect_size,
-            bbox[0] +rect_size,
-            bbox[3] +rect_size,
-            fill=rect_color,
-            tag=(f"rect_left_bottom", "move")
-            )
-        right_bottom = self.create_rectangle(
-            bbox[2] -rect_size,
-            bbox[3] -rect_size,
-            bbox[2] +rect_size,
-            bbox[3] +rect_size,
-            fill=rect_color,
-            tag=(f"rect_right_bottom", "move")
-            )
-        top = self.create_rectangle(
-            x_middle -rect_size,
-            bbox[1] -rect_size,
-            x_middle +rect_size,
-            bbox[1] +rect_size,
-            fill=rect_color,
-            tag=(f"rect_top", "move")
-            )
-        bottom = self.create_rectangle(
-            x_middle -rect_size,
-            bbox[3] -rect_size,
-            x_middle +rect_size,
-            bbox[3] +rect_size,
-            fill=rect_color,
-            tag=(f"rect_bottom", "move")
-            )
-        left = self.create_rectangle(
-            bbox[0] -rect_size,
-            y_middle -rect_size,
-            bbox[0] +rect_size,
-            y_middle +rect_size,
-            fill=rect_color,
-            tag=(f"rect_left", "move")
-            )
-        right = self.create_rectangle(
-            bbox[2] -rect_size,
-            y_middle -rect_size,
-            bbox[2] +rect_size,
-            y_middle +rect_size,
-            fill=rect_color,
-            tag=(f"rect_right", "move")
-            )
-        self.tag_bind(left_top,  "<Enter>", lambda event:self.on_mouse_enter("ul_angle"))
-        self.tag_bind(left_top,  "<Leave>", lambda event:self.on_mouse_leave())
-        self.tag_bind(right_top,  "<Enter>", lambda event:self.on_mouse_enter("ur_angle"))
-        self.tag_bind(right_top,  "<Leave>", lambda event:self.on_mouse_leave())
-        self.tag_bind(left_bottom,  "<Enter>", lambda event:self.on_mouse_enter("ll_angle"))
-        self.tag_bind(left_bottom,  "<Leave>", lambda event:self.on_mouse_leave())
-        self.tag_bind(right_bottom,  "<Enter>", lambda event:self.on_mouse_enter("lr_angle"))
-        self.tag_bind(right_bottom,  "<Leave>", lambda event:self.on_mouse_leave())
-        self.tag_bind(top,  "<Enter>", lambda event:self.on_mouse_enter("sb_v_double_arrow"))
-        self.tag_bind(top,  "<Leave>", lambda event:self.on_mouse_leave())
-        self.tag_bind(bottom,  "<Enter>", lambda event:self.on_mouse_enter("sb_v_double_arrow"))
-        self.tag_bind(bottom,  "<Leave>", lambda event:self.on_mouse_leave())
-        self.tag_bind(left,  "<Enter>", lambda event:self.on_mouse_enter("sb_h_double_arrow"))
-        self.tag_bind(left,  "<Leave>", lambda event:self.on_mouse_leave())
-        self.tag_bind(right,  "<Enter>", lambda event:self.on_mouse_enter("sb_h_double_arrow"))
-        self.tag_bind(right,  "<Leave>", lambda event:self.on_mouse_leave())
-
     def on_mouse_enter(self, anchor: str):
         self.config(cursor=anchor)
 
@@ -343,15 +376,12 @@ class CustomCanvas(tk.Canvas):
         self.config(cursor="arrow")
 
     def mouse_release(self):
-        self.move_tag_delete()
         if self.resize_direction:
+            self.resize_finish()
             self.resize_direction = False
             self.image_select(self.tag[0])
             self.on_mouse_leave()
 
-    def layer_update(self):
-        raise NotImplementedError
-
 class LayoutObjectCanvas(CustomCanvas):
     def __init__(self, parent, dataframe, *args, **kwargs):
         super().__init__(parent, *args, **kwargs)
@@ -381,19 +411,18 @@ class LayoutObjectCanvas(CustomCanvas):
         self.dict.add_object(object)
 
     def _create_canvas_object(self, obj: Obj.UNION_OBJECT):
-        self.create_image(
+        item = self.create_element(
+            obj.id,
             (obj.position[2] + obj.position[0])/2,
             (obj.position[3] + obj.position[1])/2,
             anchor="center",
-            image=obj.image_tk,
-            tag=obj.id
+            image=obj.image_tk
             )
-        self.lower(obj.id)
+        self.lower(item)
         self.object_position_update(obj.id)
 
     def delete_object(self):
         self.rect_delete()
-        self.delete(self.tag[0])
         self.dict.delete_object(self.tag[0])
         self.tag = False
 
@@ -405,47 +434,24 @@ class LayoutObjectCanvas(CustomCanvas):
         super().image_select(image_id)
         self.dict.label_frame_select(image_id)
 
-    def resize_rect(self, event):
-        self.rect_delete()
-        bbox = self.find_bbox(self.tag[0])
-        if self.resize_direction == "rect_top":
-            pos = (bbox[0], event.y, bbox[2], bbox[3])
-        elif self.resize_direction == "rect_bottom":
-            pos = (bbox[0], bbox[1], bbox[2], event.y)
-        elif self.resize_direction == "rect_left":
-            pos = (event.x, bbox[1], bbox[2], bbox[3])
-        elif self.resize_direction == "rect_right":
-            pos = (bbox[0], bbox[1], event.x, bbox[3])
-        elif self.resize_direction == "rect_left_top":
-            pos = (event.x, event.y, bbox[2], bbox[3])
-        elif self.resize_direction == "rect_right_top":
-            pos = (bbox[0], event.y, event.x, bbox[3])
-        elif self.resize_direction == "rect_left_bottom":
-            pos = (event.x, bbox[1], bbox[2], event.y)
-        elif self.resize_direction == "rect_right_bottom":
-            pos = (bbox[0], bbox[1], event.x, event.y)
-        width = pos[2] - pos[0]
-        height = pos[3] - pos[1]
-        if width > 5 and height > 5:
-            self.delete(self.tag[0])
-            self.dict.dict[self.tag[0]].object.resize((pos[2] - pos[0],
-                                                       pos[3] - pos[1]))
-            self.create_image(
-                pos[0],
-                pos[1],
-                anchor="nw",
-                image=self.dict.dict[self.tag[0]].object.image_tk,
-                tag=self.tag[0]
-                )
-            self.object_position_update(self.tag[0])
-            self.dict.object_size_update(self.tag[0])
-
-    def mouse_release(self):
-        super().mouse_release()
-        self.layer_update()
+    def resize_rect(self, pos):
+        self.dict.dict[self.tag[0]].object.resize((pos[2] - pos[0],
+                                                   pos[3] - pos[1]))
+        self.create_element(
+            self.tag[0],
+            pos[0],
+            pos[1],
+            anchor="nw",
+            image=self.dict.dict[self.tag[0]].object.image_tk
+            )
+        self.object_position_update(self.tag[0])
+        self.dict.object_size_update(self.tag[0])
 
-    def layer_update(self):
-        [self.lower(key) for key in self.dict.dict]
+    def layer_swap(self, id: str, other: str, upper: bool):
+        if upper:
+            self.tag_raise(self.items[id], self.items[other])
+        else:
+            self.tag_lower(self.items[id], self.items[other])
 
 
 
@@ -456,17 +462,15 @@ class LayoutCanvas(CustomCanvas):
         self.layout_manager: Manager.LayoutManager = layout_manager
         self.frame = frame
         self.widgets: "dict[str: LayoutViewer]" = self.layout_manager.widgets
-        self.resize_direction = False
-        self.tag = False
 
     def add_layout(self, obj: Obj.LayoutCollection):
         self.layout_manager.add_layout_collection(obj)
-        self.create_image(
+        self.create_element(
+            obj.id,
             (obj.position[2] + obj.position[0])/2,
             (obj.position[3] + obj.position[1])/2,
             anchor="center",
-            image=obj.image_tk,
-            tag=obj.id
+            image=obj.image_tk
             )
         self.widgets[obj.id] = LayoutViewer(obj, self.frame, self.image_re_create)
 
@@ -487,52 +491,29 @@ class LayoutCanvas(CustomCanvas):
         self.layout_manager.size_update(tag, (width, height))
         self.widgets[tag].size_update()
 
-    def resize_rect(self, event):
-        self.rect_delete()
-        bbox = self.find_bbox(self.tag[0])
-        if self.resize_direction == "rect_top":
-            pos = (bbox[0], event.y, bbox[2], bbox[3])
-        elif self.resize_direction == "rect_bottom":
-            pos = (bbox[0], bbox[1], bbox[2], event.y)
-        elif self.resize_direction == "rect_left":
-            pos = (event.x, bbox[1], bbox[2], bbox[3])
-        elif self.resize_direction == "rect_right":
-            pos = (bbox[0], bbox[1], event.x, bbox[3])
-        elif self.resize_direction == "rect_left_top":
-            pos = (event.x, event.y, bbox[2], bbox[3])
-        elif self.resize_direction == "rect_right_top":
-            pos = (bbox[0], event.y, event.x, bbox[3])
-        elif self.resize_direction == "rect_left_bottom":
-            pos = (event.x, bbox[1], bbox[2], event.y)
-        elif self.resize_direction == "rect_right_bottom":
-            pos = (bbox[0], bbox[1], event.x, event.y)
-        width = pos[2] - pos[0]
-        height = pos[3] - pos[1]
-        if width > 5 and height > 5:
-            self.delete(self.tag[0])
-            self.object_size_update(self.tag[0], width, height)
-            self.create_image(
-                pos[0],
-                pos[1],
-                anchor="nw",
-                image=self.layout_manager.layout_dic[self.tag[0]].image_tk,
-                tag=self.tag[0]
-                )
-            self.object_position_update(self.tag[0])
+    def resize_rect(self, pos):
+        self.object_size_update(self.tag[0], pos[2] - pos[0], pos[3] - pos[1])
+        self.create_element(
+            self.tag[0],
+            pos[0],
+            pos[1],
+            anchor="nw",
+            image=self.layout_manager.layout_dic[self.tag[0]].image_tk
+            )
+        self.object_position_update(self.tag[0])
 
     def image_re_create(self, obj: Obj.LayoutCollection):
-        self.delete(obj.id)
-        self.create_image(
+        self.create_element(
+                obj.id,
                 obj.position[0],
                 obj.position[1],
                 anchor="nw",
-                image=obj.image_tk,
-                tag=obj.id
+                image=obj.image_tk
                 )
 
     def delete_object(self):
         self.rect_delete()
-        self.delete(self.tag[0])
+        self.delete_element(self.tag[0])
         self.re_create(self.tag[0])
         self.layout_manager.delete_widget(self.tag[0])
         self.tag = False
@@ -838,9 +819,6 @@ class LayoutObjectViewer:
     def position_update(self, position):
         self.position_widget.position_update(position)
 
-    def re_pack(self):
-        self.frame.pack()
-
     def frame_pack_forget(self):
         self.frame.pack_forget()
 
@@ -876,7 +854,7 @@ class LayoutObjectCustomList:
         self.canvas._create_canvas_object(obj)
 
     def delete_object(self, id: str):
-        self.canvas.delete(id)
+        self.canvas.delete_element(id)
         self.dict[id].frame.destroy()
         del self.dict[id]
 
@@ -897,26 +875,20 @@ class LayoutObjectCustomList:
         self.dict[id].frame.config(bg="red")
 
     def layer_update(self, id: str, upper: bool):
-        new_dict = {index: obj for (index, obj) in enumerate(self.dict.values())}
-        target = [obj for obj in self.dict.values() if obj.object.id == id][0]
-        index = [key for key, value in new_dict.items() if value == target][0]
-        if len(self.dict) != 0 and len(self.dict) != 1:
-            if upper:
-                if index != 0:
-                    new_dict[index-1], new_dict[index] = new_dict[index], new_dict[index-1]
-            else:
-                if index != len(self.dict)-1:
-                    new_dict[index+1], new_dict[index] = new_dict[index], new_dict[index+1]
-            self.dict = {obj.object.id: obj for obj in new_dict.values()}
-            self.re_pack()
-            self.canvas_layer_update()
-
-    def re_pack(self):
-        [obj.frame_pack_forget() for obj in self.dict.values()]
-        [obj.re_pack() for obj in self.dict.values()]
-
-    def canvas_layer_update(self):
-        [self.canvas.lower(key) for key in self.dict]
+        # self.dict の順番が重なり順(先頭が最前面)。入れ替わる2つだけを並べ直す
+        ids = list(self.dict)
+        index = ids.index(id)
+        other = index -1 if upper else index +1
+        if other < 0 or other >= len(ids):
+            return
+        ids[index], ids[other] = ids[other], ids[index]
+        self.dict = {key: self.dict[key] for key in ids}
+        neighbor = self.dict[ids[index]]
+        if upper:
+            self.dict[id].frame.pack_configure(before=neighbor.frame)
+        else:
+            self.dict[id].frame.pack_configure(after=neighbor.frame)
+        self.canvas.layer_swap(id, neighbor.object.id, upper)
 
     def canvas_move_position(self, id: str, x: int, y: int):
         self.canvas.image_move(id, x, y)
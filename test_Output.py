@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import unittest
+from PIL import Image
+import Output
+
+
+def shared_memory_name(suffix: str) -> str:
+    return f"sh_test_{os.getpid()}_{suffix}"
+
+
+class SharedMemoryTest(unittest.TestCase):
+    def setUp(self):
+        self.name = shared_memory_name(self._testMethodName)
+        self.output = Output.SharedMemoryOutput(self.name, (64, 32))
+        self.reader = Output.SharedMemoryReader(self.name)
+
+    def tearDown(self):
+        self.reader.close()
+        self.output.close()
+
+    def test_round_trip(self):
+        image = Image.new("RGBA", (64, 32), (10, 20, 30, 40))
+        self.output.publish(image)
+        sequence, result = self.reader.read()
+        self.assertEqual(sequence, 2)
+        self.assertEqual(result.size, (64, 32))
+        self.assertEqual(result.tobytes(), image.tobytes())
+
+    def test_dirty_rects(self):
+        image = Image.new("RGBA", (64, 32), (0, 0, 0, 0))
+        self.output.publish(image)
+        changed = image.copy()
+        changed.paste((255, 0, 0, 255), (8, 4, 24, 12))
+        changed.paste((0, 255, 0, 255), (40, 20, 64, 32))
+        # 変化範囲の外は書き込まれないことを確かめるため、範囲外も変えておく
+        changed.paste((0, 0, 255, 255), (0, 28, 4, 32))
+        timing = self.output.publish(changed, [(8, 4, 24, 12), (40, 20, 64, 32)])
+        self.assertEqual(timing.size, (16 *8 +24 *12) *4)
+        sequence, result = self.reader.read()
+        self.assertEqual(sequence, 4)
+        expected = changed.copy()
+        expected.paste((0, 0, 0, 0), (0, 28, 4, 32))
+        self.assertEqual(result.tobytes(), expected.tobytes())
+
+    def test_writing_frame_is_skipped(self):
+        self.output.publish(Image.new("RGBA", (64, 32), (1, 2, 3, 4)))
+        self.output.set_sequence(self.output.sequence +1)
+        self.assertIsNone(self.reader.read(retry=3))
+        self.output.set_sequence(self.output.sequence +1)
+        self.assertEqual(self.reader.read()[0], 4)
+
+    def test_torn_read_is_retried(self):
+        old = Image.new("RGBA", (64, 32), (1, 1, 1, 1))
+        new = Image.new("RGBA", (64, 32), (2, 2, 2, 2))
+        self.output.publish(old)
+        header = self.reader.header
+        calls = []
+
+        # 1回目の読み込みで画素を読んだ直後に書き込みが入ったものとして扱う
+        def torn_header():
+            result = header()
+            calls.append(result[-1])
+            if len(calls) == 1:
+                self.output.publish(new)
+            return result
+
+        self.reader.header = torn_header
+        sequence, result = self.reader.read()
+        self.assertEqual(calls[:2], [2, 4])
+        self.assertEqual(sequence, 4)
+        self.assertEqual(result.tobytes(), new.tobytes())
+
+    def test_reopen_keeps_sequence(self):
+        self.output.publish(Image.new("RGBA", (64, 32)))
+        self.output.set_sequence(self.output.sequence +1)
+        output = Output.SharedMemoryOutput(self.name, (64, 32))
+        try:
+            self.assertEqual(output.sequence, 4)
+            output.publish(Image.new("RGBA", (64, 32)))
+            self.assertEqual(self.reader.read()[0], 6)
+        finally:
+            output.memory.close()
+
+
+class SharedMemoryResizeTest(unittest.TestCase):
+    def test_small_block_is_recreated(self):
+        name = shared_memory_name("resize")
+        small = Output.SharedMemoryOutput(name, (8, 8))
+        small.memory.close()
+        output = Output.SharedMemoryOutput(name, (64, 32))
+        try:
+            self.assertGreaterEqual(output.memory.size, Output.SHARED_MEMORY_HEADER.size +64 *4 *32)
+            image = Image.new("RGBA", (64, 32), (5, 6, 7, 8))
+            output.publish(image)
+            reader = Output.SharedMemoryReader(name)
+            self.assertEqual(reader.read()[1].tobytes(), image.tobytes())
+            reader.close()
+        finally:
+            output.close()
+
+
+if __name__ == "__main__":
+    unittest.main()